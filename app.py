@@ -1,10 +1,41 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import sys
+
+import startup
+
 import dash
 from dash import Dash, html, dcc
+from flask import Flask
+
+import correlation_engine
+import datasets
+import forecasting
+import map_geometry
+import metrics
+import payloads
+import serialization
 
-app = Dash(__name__, use_pages=True, suppress_callback_exceptions=True)
+# Load every dataset, fit the forecasts and compute the correlation matrices up front. Under gunicorn (see gunicorn.conf.py) this runs
+# once in the master and the workers share the frames copy-on-write.
+datasets.preload()
+with startup.timed('forecasts', 'all'):
+    forecasting.precompute()
+with startup.timed('correlations', 'all'):
+    correlation_engine.matrices()
+
+# Layouts and callback responses are compressed with brotli or gzip,
+# whichever the browser accepts
+server = Flask(__name__)
+server.config.update(COMPRESS_ALGORITHM=['br', 'gzip'], COMPRESS_LEVEL=6, COMPRESS_BR_LEVEL=5, COMPRESS_MIN_SIZE=500)
+serialization.use_fast_json()
+
+with startup.timed_pages():
+    app = Dash(__name__, server=server, use_pages=True, suppress_callback_exceptions=True, compress=True)
+map_geometry.register_routes(server)
+payloads.register(server)
+metrics.register(server)
 
 app.layout = html.Div([
     html.H1('Multi-page app with Dash Pages'),
@@ -16,5 +47,9 @@ app.layout = html.Div([
     dash.page_container
 ])
 
+# gunicorn.conf.py reports once the master has finished its own preloading
+if 'gunicorn' not in sys.modules:
+    startup.report()
+
 if __name__ == '__main__':
     app.run(debug=True)
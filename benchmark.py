@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Headless benchmark for the dashboard: drives the Flask server behind app.py
+# through its test client, with no browser and no network.
+#
+#     python benchmark.py                                 # every scenario, 1 worker, 4 threads
+#     python benchmark.py --workers 2 --concurrency 8 --requests 400
+#     python benchmark.py --output after.json --compare before.json
+#
+# Scenarios are the index page, the Dash layout, the page router callback for
+# every page in dash.page_registry and the plot_data callbacks of the
+# correlations, correlation matrix, timeseries and forecasts pages, plus blocks
+# of the GP practices grid. Each worker is a separate process, so the peak RSS
+# reported is per worker.
+
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DEFAULT_OUTPUT = 'benchmark.json'
+PERCENTILES = (50, 90, 99)
+
+
+def dash_output_id(outputs):
+    # The "output" key Dash's renderer sends for single and multi-output callbacks
+    if len(outputs) == 1:
+        return '{id}.{property}'.format(**outputs[0])
+    return '..' + '...'.join('{id}.{property}'.format(**o) for o in outputs) + '..'
+
+
+def callback_body(app, output_id, values, changed=None, states=()):
+    for key, spec in app.callback_map.items():
+        if output_id not in key:
+            continue
+        outputs = [{'id': part.rsplit('.', 1)[0], 'property': part.rsplit('.', 1)[1]} for part in key.strip('.').split('...')]
+        inputs = [dict(i, value=v) for i, v in zip(spec['inputs'], values)]
+        changed = changed or inputs[0]['id'] + '.' + inputs[0]['property']
+        return {'output': dash_output_id(outputs), 'outputs': outputs if len(outputs) > 1 else outputs[0],
+                'inputs': inputs, 'changedPropIds': [changed],
+                'state': [dict(s, value=v) for s, v in zip(spec.get('state', []), states)]}
+    raise LookupError('no callback for {} in app.callback_map'.format(output_id))
+
+
+def scenarios(app):
+    import dash
+    import datasets
+
+    # Dash only merges the @callback registrations into callback_map when it
+    # serves its first request
+    app.server.test_client().get('/_dash-layout')
+
+    found = {
+        'index': itertools.repeat(('GET', '/', None)),
+        'dash-layout': itertools.repeat(('GET', '/_dash-layout', None)),
+    }
+    for page in dash.page_registry.values():
+        body = callback_body(app, '_pages_content', [page['relative_path'], ''])
+        found['layout:' + page['path']] = itertools.repeat(('POST', '/_dash-update-component', body))
+
+    boards = datasets.boards('heart_prev_timeseries')
+    factors = list(datasets.frame('heart_prev_timeseries').columns[2:14])
+
+    correlations = [callback_body(app, 'heatmap-plotly-hb', [board, x, y])
+                    for board, x, y in itertools.product(boards, factors, factors)]
+    found['callback:correlations'] = itertools.cycle(('POST', '/_dash-update-component', b) for b in correlations)
+
+    # In clientside mode the timeseries page draws in the browser
+    if sys.modules['pages.timeseries'].TIMESERIES_MODE != 'clientside':
+        timeseries = [callback_body(app, 'line-graph-plotly', [board, factors[:n]])
+                      for board, n in itertools.product(boards, (1, 3, 6))]
+        found['callback:timeseries'] = itertools.cycle(('POST', '/_dash-update-component', b) for b in timeseries)
+
+    matrices = [callback_body(app, 'matrix-graph-plotly', [scope, method, 2024, board])
+                for scope, method, board in itertools.product(('boards', 'time'), ('pearson', 'spearman'), boards)]
+    found['callback:correlation-matrix'] = itertools.cycle(('POST', '/_dash-update-component', b) for b in matrices)
+
+    practices = []
+    for board, sort in itertools.product(boards, (None, [{'colId': factors[0], 'sort': 'desc'}])):
+        for start in range(0, 400, 100):
+            request = {'startRow': start, 'endRow': start + 100, 'sortModel': sort or [],
+                       'filterModel': {'Health Boards': {'filterType': 'text', 'type': 'equals', 'filter': board}}}
+            columns = [{'field': c} for c in ('Health Boards', 'Year', 'GPPractice/Area', 'Age', 'Sex', factors[0])]
+            practices.append(callback_body(app, 'practice-grid.getRowsResponse', [request], states=[columns]))
+    found['callback:practices'] = itertools.cycle(('POST', '/_dash-update-component', b) for b in practices)
+
+    forecasts = [callback_body(app, 'forecast-graph-plotly', [board, factor, method])
+                 for board, factor, method in itertools.product(boards, factors, ('auto', 'linear', 'holt'))]
+    found['callback:forecasts'] = itertools.cycle(('POST', '/_dash-update-component', b) for b in forecasts)
+    return found
+
+
+def run_scenario(app, requests, total, concurrency, headers):
+    lock = threading.Lock()
+    latencies, sizes, errors = [], [], []
+
+    def work(count):
+        client = app.server.test_client()
+        for _ in range(count):
+            with lock:
+                method, path, body = next(requests)
+            start = time.perf_counter()
+            if method == 'GET':
+                response = client.get(path, headers=headers)
+            else:
+                response = client.post(path, json=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(len(response.data))
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=work, args=(n,)) for n in shares if n]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {'latencies': latencies, 'sizes': sizes, 'errors': len(errors), 'wall': time.perf_counter() - start}
+
+
+def worker(args):
+    selected, total, concurrency, headers = args
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app
+    import_seconds = time.perf_counter() - start
+
+    results = {}
+    for name, requests in scenarios(app).items():
+        if selected and not any(name.startswith(s) for s in selected):
+            continue
+        run_scenario(app, requests, concurrency, concurrency, headers)  # warm-up, one request per thread
+        results[name] = run_scenario(app, requests, total, concurrency, headers)
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    payloads = app.server.test_client().get('/_payload-report').get_json()
+    return {'pid': os.getpid(), 'import_seconds': import_seconds, 'peak_rss_mb': rss_kb / 1024, 'scenarios': results,
+            'payloads': payloads}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarise(worker_results):
+    names = sorted(set().union(*(w['scenarios'] for w in worker_results)))
+    summary = {}
+    for name in names:
+        runs = [w['scenarios'][name] for w in worker_results if name in w['scenarios']]
+        latencies = [l for r in runs for l in r['latencies']]
+        sizes = [s for r in runs for s in r['sizes']]
+        wall = max(r['wall'] for r in runs)
+        summary[name] = {
+            'requests': len(latencies),
+            'errors': sum(r['errors'] for r in runs),
+            'throughput_rps': len(latencies) / wall if wall else None,
+            'mean_ms': 1000 * sum(latencies) / len(latencies),
+            **{'p{}_ms'.format(q): 1000 * percentile(latencies, q) for q in PERCENTILES},
+            'mean_bytes': sum(sizes) / len(sizes),
+            'max_bytes': max(sizes),
+        }
+    return summary
+
+
+def merge_payloads(worker_results):
+    # Bytes per endpoint before and after compression, from payloads.py
+    merged = {}
+    for w in worker_results:
+        for name, entry in (w['payloads'] or {}).items():
+            total = merged.setdefault(name, {'count': 0, 'raw_bytes': 0, 'sent_bytes': 0})
+            for key in total:
+                total[key] += entry[key]
+    for total in merged.values():
+        total['mean_raw_bytes'] = total['raw_bytes'] / total['count']
+        total['mean_sent_bytes'] = total['sent_bytes'] / total['count']
+    return merged
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(summary, baseline=None):
+    print('{:<28} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10}'.format('scenario', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'errors', 'bytes'))
+    for name, s in summary.items():
+        print('{:<28} {:>8.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9} {:>10.0f}'.format(
+            name, s['throughput_rps'], s['p50_ms'], s['p90_ms'], s['p99_ms'], s['errors'], s['mean_bytes']))
+        old = (baseline or {}).get(name)
+        if old:
+            print('{:<28} {:>+7.0f}% {:>+8.0f}% {:>+8.0f}% {:>+8.0f}% {:>9} {:>+9.0f}%'.format(
+                '  vs baseline', *(100 * (s[k] / old[k] - 1) if old[k] else 0 for k in ('throughput_rps', 'p50_ms', 'p90_ms', 'p99_ms')),
+                '', 100 * (s['mean_bytes'] / old['mean_bytes'] - 1) if old['mean_bytes'] else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard layouts and callbacks without a browser.')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, each with its own copy of the app')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent client threads per worker')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario per worker')
+    parser.add_argument('--scenario', action='append', help='only run scenarios whose name starts with this')
+    parser.add_argument('--accept-encoding', default=None, help="Accept-Encoding header to send, e.g. 'gzip, br'")
+    parser.add_argument('--keep-figure-cache', action='store_true', help='reuse the on-disk figure cache instead of a fresh one')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write the JSON results')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    args = parser.parse_args()
+
+    headers = {'Accept-Encoding': args.accept_encoding} if args.accept_encoding else {}
+
+    # A fresh figure cache is removed once the workers are done with it
+    with contextlib.ExitStack() as stack:
+        if not args.keep_figure_cache:
+            os.environ['FIGURE_CACHE_DIR'] = stack.enter_context(tempfile.TemporaryDirectory(prefix='figure-cache-'))
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(args.workers) as pool:
+            worker_results = pool.map(worker, [(args.scenario, args.requests, args.concurrency, headers)] * args.workers)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'workers': [{k: w[k] for k in ('pid', 'import_seconds', 'peak_rss_mb')} for w in worker_results],
+        'scenarios': summarise(worker_results),
+        'payloads': merge_payloads(worker_results),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+    print_table(results['scenarios'], baseline)
+    print()
+    print('{:<72} {:>12} {:>12}'.format('endpoint', 'raw bytes', 'sent bytes'))
+    for name, p in results['payloads'].items():
+        print('{:<72} {:>12.0f} {:>12.0f}'.format(name[:72], p['mean_raw_bytes'], p['mean_sent_bytes']))
+    for w in results['workers']:
+        print('worker {pid}: app import {import_seconds:.2f}s, peak RSS {peak_rss_mb:.0f} MB'.format(**w))
+    print('results written to', args.output)
+
+
+if __name__ == '__main__':
+    main()
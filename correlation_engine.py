@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# All-pairs correlations between the heart disease related factors.
+#
+# heart_prev_timeseries.csv is held as a (board x year x factor) array and the
+# full factor x factor Pearson and Spearman matrices are computed in one NumPy
+# pass for two views of it: across the health boards in each year, and over
+# the years within each health board. Each pair of factors is compared (and,
+# for Spearman, ranked) on the samples where both are observed, as
+# DataFrame.corr does. Permutation p-values reorder those shared samples for
+# every factor pair and every permutation in the same batch (exhaustively when
+# there are few enough orderings, as for the four years within a board).
+# Everything is computed once per dataset version.
+
+import itertools
+import math
+
+import numpy as np
+
+import datasets
+
+DATASET = 'heart_prev_timeseries'
+METHODS = ('pearson', 'spearman')
+ACROSS_BOARDS = 'boards'  # one matrix per year, boards as samples
+WITHIN_BOARD = 'time'  # one matrix per board, years as samples
+PERMUTATIONS = 999
+MIN_PAIRS = 3  # fewer shared samples than this gives no correlation
+SEED = 2025
+
+
+def pairwise(x):
+    """Every factor pair of x (..., sample, factor) as two (..., sample,
+    factor, factor) arrays holding the first and the second factor of each
+    pair, both NaN wherever either factor is missing. Each pair is then
+    compared on exactly the samples it shares."""
+    a = np.broadcast_to(x[..., :, None], x.shape + x.shape[-1:])
+    b = np.swapaxes(a, -1, -2)
+    shared = ~np.isnan(a) & ~np.isnan(b)
+    return np.where(shared, a, np.nan), np.where(shared, b, np.nan)
+
+
+def average_ranks(x, axis=-3):
+    """Ranks along axis with ties given their average rank. NaN stays NaN and
+    is left out of the ranking."""
+    y = np.moveaxis(x, axis, -1)
+    below = (y[..., None, :] < y[..., :, None]).sum(axis=-1)
+    tied = (y[..., None, :] == y[..., :, None]).sum(axis=-1)
+    return np.moveaxis(np.where(np.isnan(y), np.nan, below + (tied + 1) / 2), -1, axis)
+
+
+def paired_correlation(a, b):
+    """Pearson r between a and b along the sample axis (-3) of pairwise()
+    arrays, which are NaN at the same samples. Returns r and the number of
+    samples each pair shares."""
+    seen = ~np.isnan(a)
+    n = seen.sum(axis=-3)
+    # A factor that is constant over the shared samples has no correlation;
+    # its centred values below need not come out exactly zero
+    varies = lambda x: np.fmax.reduce(x, axis=-3) > np.fmin.reduce(x, axis=-3)
+    valid = (n >= MIN_PAIRS) & varies(a) & varies(b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.where(seen, a - np.nansum(a, axis=-3, keepdims=True) / n[..., None, :, :], 0)
+        b = np.where(seen, b - np.nansum(b, axis=-3, keepdims=True) / n[..., None, :, :], 0)
+        r = (a * b).sum(axis=-3) / np.sqrt((a * a).sum(axis=-3) * (b * b).sum(axis=-3))
+    return np.where(valid, np.clip(r, -1, 1), np.nan), n
+
+
+def _restricted_orders(orders, n):
+    # Each ordering of all the samples with the samples from n on dropped: an
+    # ordering of the first n samples, uniformly so if orders is. Samples
+    # from n on keep their places after them.
+    kept = np.argsort(orders >= n, axis=-1, kind='stable')
+    restricted = np.take_along_axis(orders, kept, axis=-1)
+    return np.where(np.arange(orders.shape[-1]) < n, restricted, np.arange(orders.shape[-1]))
+
+
+def permutation_pvalues(a, b, r, permutations=PERMUTATIONS, rng=None):
+    """Two-sided p-values for the correlations r of the pairwise() arrays a
+    and b, from the share of orderings of each pair's shared samples that
+    correlate at least as strongly. Only the samples a pair shares are
+    reordered, so every ordering has the same samples and n as the observed
+    correlation."""
+    samples, factors = a.shape[-3], a.shape[-1]
+    exact = math.factorial(samples) <= permutations
+    if exact:
+        orders = np.array(list(itertools.permutations(range(samples))))
+    else:
+        rng = rng or np.random.default_rng(SEED)
+        orders = np.argsort(rng.random((permutations, samples)), axis=1)
+
+    # Each pair once, as one column per (leading index, pair) with its shared
+    # samples moved to the front in their original order
+    first, second = np.triu_indices(factors, 1)
+    shape = r.shape[:-2] + first.shape
+    a, b = (np.moveaxis(x[..., first, second], -2, 0).reshape(samples, -1) for x in (a, b))
+    front = np.argsort(np.isnan(a), axis=0, kind='stable')
+    a, b = np.take_along_axis(a, front, axis=0), np.take_along_axis(b, front, axis=0)
+    n = (~np.isnan(a)).sum(axis=0)
+    observed = np.abs(r[..., first, second]).reshape(-1)
+
+    # Reordering a pair's samples leaves each factor's mean and spread alone,
+    # so r for any ordering is the dot product of the centred values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = np.nan_to_num(a - np.nansum(a, axis=0) / n)
+        b = np.nan_to_num(b - np.nansum(b, axis=0) / n)
+        scale = np.sqrt((a * a).sum(axis=0) * (b * b).sum(axis=0))
+        as_strong = np.zeros(n.shape)
+        for shared in np.unique(n[n >= MIN_PAIRS]):
+            columns = np.flatnonzero(n == shared)
+            shuffled = b[:, columns][_restricted_orders(orders, shared)]
+            null = np.einsum('sc,psc->pc', a[:, columns], shuffled) / scale[columns]
+            as_strong[columns] = (np.abs(null) >= observed[columns] - 1e-12).sum(axis=0)
+    if exact:
+        p = as_strong / len(orders)
+    else:
+        p = (as_strong + 1) / (permutations + 1)
+    p = np.where(np.isnan(observed), np.nan, p).reshape(shape)
+
+    matrix = np.full(r.shape, np.nan)
+    matrix[..., first, second] = matrix[..., second, first] = p
+    return matrix
+
+
+class CorrelationMatrices:
+
+    def __init__(self, df):
+        self.factors = list(df.columns[2:14])
+        self.boards, self.years, self.values = datasets.cube(DATASET, self.factors)
+        rng = np.random.default_rng(SEED)
+
+        samples = {ACROSS_BOARDS: self.values.transpose(1, 0, 2), WITHIN_BOARD: self.values}
+        self.r, self.p, self.n = {}, {}, {}
+        for method, scope in itertools.product(METHODS, samples):
+            a, b = pairwise(samples[scope])
+            if method == 'spearman':
+                # Ranked per pair, over the samples both factors share
+                a, b = average_ranks(a), average_ranks(b)
+            r, n = paired_correlation(a, b)
+            self.r[method, scope] = r
+            self.n[method, scope] = n
+            self.p[method, scope] = permutation_pvalues(a, b, r, rng=rng)
+
+    def _position(self, scope, key):
+        if scope == ACROSS_BOARDS:
+            return int(np.searchsorted(self.years, int(key)))
+        return self.boards.index(key)
+
+    def matrix(self, method, scope, key):
+        """r, p and shared sample counts for every factor pair, for one year
+        (ACROSS_BOARDS) or one health board (WITHIN_BOARD)."""
+        i = self._position(scope, key)
+        return self.r[method, scope][i], self.p[method, scope][i], self.n[method, scope][i]
+
+    def pair(self, method, scope, key, x, y):
+        i, a, b = self._position(scope, key), self.factors.index(x), self.factors.index(y)
+        return self.r[method, scope][i, a, b], self.p[method, scope][i, a, b]
+
+    def across_boards(self, year, factors):
+        # (factor x board) values in one year
+        return self.values[:, self._position(ACROSS_BOARDS, year), [self.factors.index(f) for f in factors]].T
+
+    def within_board(self, board, factors):
+        # (factor x year) values for one board
+        return self.values[self._position(WITHIN_BOARD, board), :, [self.factors.index(f) for f in factors]]
+
+
+# Cached per dataset version
+
+def matrices():
+    return datasets.derived(DATASET, 'correlations', CorrelationMatrices)
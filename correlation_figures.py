@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Figures for the correlations page, sliced out of correlation_engine's arrays
+# once per (health board, factor, factor) and served from figure_cache
+# afterwards.
+#
+#     python correlation_figures.py          # warm the default board for every factor pair
+#     python correlation_figures.py --all    # warm every board
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import correlation_engine
+import datasets
+from figure_cache import FigureCache
+
+DATASET = 'heart_prev_timeseries'
+HEATMAP_YEAR = 2025
+DEFAULT_BOARD = 'Ayrshire and Arran'
+
+cache = FigureCache('correlations')
+
+
+def factors():
+    return correlation_engine.matrices().factors
+
+
+def ols_trendline(x, y):
+    # Closed-form least squares fit, the same line px's trendline='ols' draws
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    if len(x) < 2 or np.ptp(x) == 0:
+        return None
+    x_mean, y_mean = x.mean(), y.mean()
+    slope = ((x - x_mean) * (y - y_mean)).sum() / ((x - x_mean) ** 2).sum()
+    intercept = y_mean - slope * x_mean
+    order = np.argsort(x)
+    return x[order], intercept + slope * x[order], slope, intercept
+
+
+def heatmap_figure(values, factors, columns, axis_title, title):
+    import plotly.express as px
+
+    # Boards or years with no data for either factor are left out, as pivot_table did
+    cols = ~np.isnan(values).all(axis=0)
+    values = values[:, cols]
+    fig = px.imshow(values, x=list(np.asarray(columns)[cols]), y=factors,
+                    labels={'x': axis_title}, title=title)
+    fig = fig.update_traces(text=values, texttemplate="%{text}")
+    return fig.update_xaxes(tickangle=330, automargin=True)
+
+
+def trendline_figure(x, y, selected_xaxis, selected_yaxis, r, p, title):
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    fig = px.scatter(x=x, y=y, labels={'x': selected_xaxis, 'y': selected_yaxis}, title=title)
+    fit = ols_trendline(x, y)
+    if fit is not None:
+        x, fitted, slope, intercept = fit
+        fig.add_trace(go.Scatter(
+            x=x, y=fitted, mode='lines', showlegend=False,
+            hovertemplate="<b>OLS trendline</b><br>{} = {:g} * {} + {:g}<br>R<sup>2</sup>={:f}<br>permutation p={:.3f}<br><br>{}=%{{x}}<br>{}=%{{y}} <b>(trend)</b><extra></extra>".format(
+                selected_yaxis, slope, selected_xaxis, intercept, r ** 2, p, selected_xaxis, selected_yaxis),
+        ))
+    return fig.update_xaxes(tickangle=330, automargin=True)
+
+
+def build_figures(healthboard, selected_xaxis, selected_yaxis):
+    # Every figure is a slice of the precomputed (board x year x factor) array
+    # and correlation matrices
+    engine = correlation_engine.matrices()
+    selected = sorted({selected_xaxis, selected_yaxis})  # pivot_table's factor order
+
+    heat_hb = np.round(engine.across_boards(HEATMAP_YEAR, selected), 2)
+    heat_time = np.round(engine.within_board(healthboard, selected), 2)
+    x, y = np.round(engine.within_board(healthboard, [selected_xaxis, selected_yaxis]), 2)
+    r, p = engine.pair('pearson', correlation_engine.WITHIN_BOARD, healthboard, selected_xaxis, selected_yaxis)
+
+    fig_heatmap_hb = heatmap_figure(heat_hb, selected, engine.boards, 'Health Boards', "Figure 1: Heatmap of Heart Disease related factors in Scottish Health Boards in 2025")
+    fig_trendline_plotly = trendline_figure(x, y, selected_xaxis, selected_yaxis, r, p, "Figure 2: Correlation of Heart Disease related factors in "+healthboard+" 2022-2025")
+    fig_heatmap_time = heatmap_figure(heat_time, selected, engine.years, 'Year', "Figure 3: Heatmap of Heart Disease related factors in "+healthboard+" 2022-2025")
+
+    return fig_heatmap_hb, fig_trendline_plotly, fig_heatmap_time
+
+
+def figures(healthboard, selected_xaxis, selected_yaxis):
+    key = (datasets.version(DATASET), healthboard, selected_xaxis, selected_yaxis)
+    return cache.get(key, lambda: build_figures(healthboard, selected_xaxis, selected_yaxis))
+
+
+def matrix_figure(method, scope, key):
+    import plotly.express as px
+
+    engine = correlation_engine.matrices()
+    r, p, n = engine.matrix(method, scope, key)
+    text = [['r={:.2f}<br>p={:.3f}<br>n={}'.format(r[i, j], p[i, j], n[i, j]) for j in range(len(r))] for i in range(len(r))]
+    where = "across Scottish Health Boards in {}".format(key) if scope == correlation_engine.ACROSS_BOARDS else "in {} 2022-2025".format(key)
+    fig = px.imshow(r, x=engine.factors, y=engine.factors, zmin=-1, zmax=1, color_continuous_scale='RdBu_r',
+                    title="{} correlation of Heart Disease related factors {}".format(method.capitalize(), where))
+    fig = fig.update_traces(text=text, texttemplate="%{z:.2f}", hovertemplate="%{y}<br>%{x}<br>%{text}<extra></extra>")
+    return fig.update_xaxes(tickangle=330, automargin=True)
+
+
+def matrix(method, scope, key):
+    cache_key = (datasets.version(DATASET), 'matrix', method, scope, key)
+    return cache.get(cache_key, lambda: [matrix_figure(method, scope, key)])[0]
+
+
+def warm(boards=(DEFAULT_BOARD,)):
+    built = 0
+    for healthboard, (selected_xaxis, selected_yaxis) in itertools.product(boards, itertools.product(factors(), repeat=2)):
+        figures(healthboard, selected_xaxis, selected_yaxis)
+        built += 1
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the correlations page figures into the shared figure cache.')
+    parser.add_argument('--all', action='store_true', help='warm every health board, not just the default one')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    built = warm(datasets.boards(DATASET) if args.all else (DEFAULT_BOARD,))
+    print('{} figure sets ready in {:.1f}s ({})'.format(built, time.perf_counter() - start, cache.stats))
+
+
+if __name__ == '__main__':
+    main()
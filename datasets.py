@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shared in-process data access for the dashboard pages.
+#
+# Each dataset is read once per worker from the local files in the repo and
+# pre-indexed by health board, so callbacks only do a dictionary lookup. The
+# file is re-checked at most every CHECK_INTERVAL seconds and only reloaded
+# when its mtime changes *and* its content hash differs. When etl.py has
+# written an up-to-date Parquet copy of a dataset it is read instead of the CSV.
+# Results derived from a dataset (forecasts, correlation matrices) hang off the
+# loaded snapshot, so they are rebuilt exactly when the data changes.
+#
+# The pages define layout() as a function, which Dash calls on each page
+# request, rather than building their layout at import. A reloaded dataset then
+# reaches their dropdowns, grids and figures, and the GP practice store is only
+# opened once its page is visited.
+
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import startup
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Callbacks get the cached frames themselves rather than copies; copy-on-write
+# (always on from pandas 3) keeps any accidental mutation in a callback from
+# leaking into the cache.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECK_INTERVAL = 2.0
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """One loaded version of a dataset, with its board index."""
+
+    def __init__(self, frame, version, board_column):
+        self.frame = frame
+        self.version = version
+        self.by_board = self._index(board_column)
+        self.boards = sorted(self.by_board)
+        self.derived = {}
+
+    def _index(self, column):
+        if column is None or column not in self.frame.columns:
+            return {}
+        # Sorted once (stably, so rows keep their order within a group), each
+        # group is then a contiguous slice: a view, not a copy
+        ordered = self.frame
+        if not ordered[column].is_monotonic_increasing:
+            ordered = ordered.sort_values(column, kind='stable')
+        keys = ordered[column].to_numpy()
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        stops = np.r_[starts[1:], len(keys)]
+        return {keys[start]: ordered.iloc[start:stop] for start, stop in zip(starts, stops) if not pd.isna(keys[start])}
+
+
+class Dataset:
+
+    def __init__(self, filename, board_column='Health Boards', year_column='Year', index_col=None, exclude=()):
+        self.filename = filename
+        self.board_column = board_column
+        self.year_column = year_column
+        self.index_col = index_col
+        self.exclude = exclude
+        self._lock = startup.fork_safe_lock()
+        self._snapshot = None
+        self._path = None
+        self._mtime = None
+        self._hash = None
+        self._checked = 0.0
+        self._loads = 0
+
+    @property
+    def csv_path(self):
+        return os.path.join(DATA_DIR, self.filename)
+
+    @property
+    def columnar_path(self):
+        return os.path.splitext(self.csv_path)[0] + '.parquet'
+
+    @property
+    def path(self):
+        columnar = self.columnar_path
+        if pq is not None and os.path.exists(columnar):
+            if os.stat(columnar).st_mtime_ns >= os.stat(self.csv_path).st_mtime_ns:
+                return columnar
+        return self.csv_path
+
+    def read_csv(self):
+        usecols = (lambda c: c not in self.exclude) if self.exclude else None
+        return pd.read_csv(self.csv_path, index_col=self.index_col, usecols=usecols)
+
+    def _read(self):
+        if self._path != self.columnar_path:
+            return self.read_csv()
+        columns = None
+        if self.exclude:
+            columns = [c for c in pq.read_schema(self._path).names if c not in self.exclude]
+        return pd.read_parquet(self._path, columns=columns)
+
+    def _refresh(self):
+        # Called with the lock held. Returns True if the cached data is stale.
+        now = time.monotonic()
+        if self._hash is not None and now - self._checked < CHECK_INTERVAL:
+            return False
+        self._checked = now
+        path = self.path
+        mtime = os.stat(path).st_mtime_ns
+        if path == self._path and mtime == self._mtime:
+            return False
+        digest = file_hash(path)
+        changed = path != self._path or digest != self._hash
+        self._path = path
+        self._mtime = mtime
+        if not changed:
+            return False
+        self._hash = digest
+        self._snapshot = None
+        return True
+
+    def snapshot(self):
+        with metrics.phase('data'), self._lock:
+            self._refresh()
+            if self._snapshot is None:
+                start = time.perf_counter()
+                self._snapshot = Snapshot(self._read(), self._hash, self.board_column)
+                metrics.dataset_loaded(os.path.splitext(self.filename)[0], time.perf_counter() - start, reload=self._loads > 0)
+                self._loads += 1
+            return self._snapshot
+
+
+DATASETS = {
+    'heart_prev_timeseries': Dataset('heart_prev_timeseries.csv', index_col=0),
+    'heart_prev_mapped': Dataset('heart_prev_mapped.csv', board_column='HBName', year_column=None,
+                                 index_col='HBCode', exclude=('geometry',)),
+    'median_age_hb_timeseries': Dataset('median_age_hb_timeseries.csv', index_col=0),
+    'median_SIMD_hb_timeseries': Dataset('median_SIMD_hb_timeseries.csv', board_column='Category', index_col=0),
+    'population_estimates': Dataset('nrs-mid-year-population-estimates-time-series-data-1981-2024.csv', board_column='Area name'),
+}
+
+
+def dataset_for(filename):
+    for dataset in DATASETS.values():
+        if dataset.filename == filename:
+            return dataset
+    return None
+
+
+def frame(name):
+    return DATASETS[name].snapshot().frame
+
+
+def by_board(name, board):
+    return DATASETS[name].snapshot().by_board[board]
+
+
+def boards(name):
+    return DATASETS[name].snapshot().boards
+
+
+def version(name):
+    return DATASETS[name].snapshot().version
+
+
+_derived_lock = startup.fork_safe_lock(threading.RLock)
+
+
+def derived(name, key, build):
+    """build(frame) for the current version of the dataset, computed once and
+    kept until the dataset is reloaded."""
+    snap = DATASETS[name].snapshot()
+    with metrics.phase('data'), _derived_lock:
+        if key not in snap.derived:
+            snap.derived[key] = build(snap.frame)
+        return snap.derived[key]
+
+
+def cube(name, columns):
+    """The columns as a (board x year x column) float array, NaN where a board
+    has no row for a year. Returns (boards, years, array)."""
+    dataset = DATASETS[name]
+    columns = tuple(columns)
+
+    def build(df):
+        boards = sorted(df[dataset.board_column].unique())
+        years = np.array(sorted(df[dataset.year_column].unique()))
+        full = df.set_index([dataset.board_column, dataset.year_column]).reindex(pd.MultiIndex.from_product([boards, years]))
+        values = full[list(columns)].to_numpy(dtype=float).reshape(len(boards), len(years), len(columns))
+        return boards, years, values
+
+    return derived(name, ('cube', columns), build)
+
+
+def preload():
+    for name, dataset in DATASETS.items():
+        with startup.timed('dataset', name):
+            dataset.snapshot()
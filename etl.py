@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Build the derived datasets used by the dashboard from the raw PHS, NRS and
+# Scottish Government source files.
+#
+#     python etl.py                 # rebuild the stages whose inputs changed
+#     python etl.py --force         # rebuild everything
+#     python etl.py --stage median_age
+#
+# Each stage records the sha256 of its inputs and outputs in .etl_manifest.json
+# and is skipped when none of them have changed since the last run. Every output
+# is also written as Parquet (when pyarrow is installed), which datasets.py
+# prefers over the CSV. The geometry stage needs shapely and pyproj, and the
+# practices stage (the GP practice drill-down store) needs pyarrow.
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import datasets
+import map_geometry
+import practice_store
+from datasets import DATA_DIR, file_hash
+
+FIRST_YEAR = 2022
+CHUNKSIZE = 50000
+MANIFEST = os.path.join(DATA_DIR, '.etl_manifest.json')
+
+PREVALENCE_SOURCE = 'diseaseprevalenceingeneralpractice_board_total.csv'
+POPULATION_SOURCE = 'nrs-mid-year-population-estimates-time-series-data-*.csv'
+BMI_SOURCE = 'epidemiological_BMI_primary1_hb.csv'
+SIMD_SOURCE = 'SIMD_Quintiles_*.csv'
+
+MEDIAN_AGE_OUTPUT = 'median_age_hb_timeseries.csv'
+MEDIAN_SIMD_OUTPUT = 'median_SIMD_hb_timeseries.csv'
+TIMESERIES_OUTPUT = 'heart_prev_timeseries.csv'
+MAPPED_OUTPUT = 'heart_prev_mapped.csv'
+
+RATE_COLUMNS = [
+    'Rate_Atrial Fibrillation',
+    'Rate_Chronic Kidney Disease (CKD)',
+    'Rate_Coronary Heart Disease (CHD)',
+    'Rate_Diabetes',
+    'Rate_Heart Failure',
+    'Rate_Hypertension',
+    'Rate_Peripheral Arterial Disease (PAD)',
+]
+BMI_COLUMN = 'percentage_epidemiologically_overweight_or_obese_primary_1s'
+AGE_COLUMNS = [str(age) for age in range(91)]  # NRS single years of age, '90' is 90 and over
+QUINTILE_COLUMNS = ['{} (%)'.format(q) for q in range(1, 6)]
+
+
+def data_path(filename):
+    return os.path.join(DATA_DIR, filename)
+
+
+def latest(pattern):
+    # New NRS releases change the year range in the file name
+    matches = sorted(glob.glob(data_path(pattern)))
+    return os.path.basename(matches[-1]) if matches else pattern
+
+
+def read_filtered(filename, usecols, keep):
+    chunks = pd.read_csv(data_path(filename), usecols=usecols, chunksize=CHUNKSIZE, encoding='utf-8-sig')
+    return pd.concat([chunk.loc[keep(chunk)] for chunk in chunks], ignore_index=True)
+
+
+def board_codes():
+    codes = pd.read_csv(data_path(latest(POPULATION_SOURCE)), usecols=['Area code', 'Area name'], encoding='utf-8-sig')
+    return codes.drop_duplicates().set_index('Area code')['Area name']
+
+
+# Stages
+
+def build_median_age():
+    population = read_filtered(latest(POPULATION_SOURCE), ['Area name', 'Sex', 'Year'] + AGE_COLUMNS,
+                               lambda c: (c['Sex'] == 'Persons') & (c['Year'] >= FIRST_YEAR))
+    counts = population[AGE_COLUMNS].to_numpy(dtype=np.int64)
+    total = counts.sum(axis=1)
+    ages = np.arange(counts.shape[1])
+    median = (counts.cumsum(axis=1) >= total[:, None] / 2).argmax(axis=1)
+    df = pd.DataFrame({
+        'Health Boards': population['Area name'],
+        'pop_median_age': median.astype(float),
+        'pop_mean_age': (counts @ ages / total).round(2),
+        'population_count': total,
+        'Year': population['Year'],
+    })
+    df = df.sort_values(['Year', 'Health Boards'], ascending=[False, True])
+    df.index = df.groupby('Year').cumcount()
+    df.to_csv(data_path(MEDIAN_AGE_OUTPUT))
+
+
+def simd_quintiles(filename):
+    year = int(re.search(r'(\d{4})', filename).group(1))
+    survey = pd.read_csv(data_path(filename), usecols=['Variable', 'Category'] + QUINTILE_COLUMNS, na_values='.', encoding='utf-8-sig')
+    survey = survey.loc[survey['Variable'] == 'Health Board'].reset_index(drop=True)
+    # The published figures treat the whole-number part of each quintile
+    # percentage as a respondent count, so the median can fall between quintiles
+    counts = np.floor(survey[QUINTILE_COLUMNS].fillna(0).to_numpy()).astype(np.int64)
+    n = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    lower = (cumulative > ((n - 1) // 2)[:, None]).argmax(axis=1) + 1
+    upper = (cumulative > (n // 2)[:, None]).argmax(axis=1) + 1
+    return pd.DataFrame({
+        'Category': survey['Category'],
+        'median_SIMD_Quintile': (lower + upper) / 2,
+        'mean_SIMD_Quintile': (counts @ np.arange(1, 6) / n).round(2),
+        'Year': year,
+    })
+
+
+def build_median_simd():
+    df = pd.concat([simd_quintiles(os.path.basename(f)) for f in glob.glob(data_path(SIMD_SOURCE))], ignore_index=True)
+    # Keep earlier survey years whose source tables are no longer in the repo
+    if os.path.exists(data_path(MEDIAN_SIMD_OUTPUT)):
+        previous = pd.read_csv(data_path(MEDIAN_SIMD_OUTPUT), index_col=0)
+        df = pd.concat([df, previous.loc[~previous['Year'].isin(df['Year'])]], ignore_index=True)
+    df = df.sort_values('Year', ascending=False, kind='stable')
+    df.index = df.groupby('Year').cumcount()
+    df.to_csv(data_path(MEDIAN_SIMD_OUTPUT))
+
+
+def build_timeseries():
+    prevalence = read_filtered(PREVALENCE_SOURCE, ['GPPractice/Area', 'Year', 'Age', 'Sex', 'AreaType'] + RATE_COLUMNS,
+                               lambda c: (c['Age'] == 'All') & (c['Sex'] == 'All') & (c['AreaType'] == 'Board'))
+    prevalence['Health Boards'] = prevalence['GPPractice/Area'].str.replace('^NHS ', '', regex=True)
+    df = prevalence[['Year', 'Health Boards'] + RATE_COLUMNS]
+
+    bmi = pd.read_csv(data_path(BMI_SOURCE), usecols=['SchoolYear', 'HBR', 'EpiOverweightAndObese'], encoding='utf-8-sig')
+    bmi = pd.DataFrame({
+        'Year': (bmi['SchoolYear'].str[:2] + bmi['SchoolYear'].str[-2:]).astype(int),  # 2021/22 -> 2022
+        'Health Boards': bmi['HBR'].map(board_codes()),
+        BMI_COLUMN: bmi['EpiOverweightAndObese'] * 100,
+    }).dropna(subset=['Health Boards'])
+
+    simd = pd.read_csv(data_path(MEDIAN_SIMD_OUTPUT), index_col=0)
+    simd = pd.DataFrame({
+        'Year': simd['Year'],
+        'Health Boards': simd['Category'].str.replace('&', 'and'),
+        'pop_median_SIMD_Quintile': simd['median_SIMD_Quintile'],
+        'pop_mean_SIMD_Quintile': simd['mean_SIMD_Quintile'],
+    })
+    age = pd.read_csv(data_path(MEDIAN_AGE_OUTPUT), index_col=0)
+
+    for other in (bmi, simd, age):
+        df = df.merge(other, how='left', on=['Year', 'Health Boards'])
+    df = df.sort_values(['Health Boards', 'Year']).reset_index(drop=True)
+    df['population_count'] = df['population_count'].astype(float)
+    df.to_csv(data_path(TIMESERIES_OUTPUT))
+
+
+def build_mapped():
+    timeseries = pd.read_csv(data_path(TIMESERIES_OUTPUT), index_col=0)
+    metrics = RATE_COLUMNS + [BMI_COLUMN, 'pop_median_SIMD_Quintile', 'pop_mean_SIMD_Quintile', 'pop_median_age', 'pop_mean_age']
+    # Latest available value of each metric per board
+    df = timeseries.sort_values('Year').groupby('Health Boards')[metrics].last()
+    df[BMI_COLUMN] = df[BMI_COLUMN].round(2)
+    df = df.rename(columns={'pop_median_SIMD_Quintile': 'pop_median_SIMD_quintile',
+                            'pop_mean_SIMD_Quintile': 'pop_mean_SIMD_quintile'})
+    # Board boundaries are not part of the raw sources, so the geometry is
+    # carried over from the previous build
+    geometry = pd.read_csv(data_path(MAPPED_OUTPUT), usecols=['HBCode', 'HBName', 'geometry'])
+    df = geometry.merge(df, how='left', left_on='HBName', right_index=True)
+    df.sort_values('HBName').to_csv(data_path(MAPPED_OUTPUT), index=False)
+
+
+def build_geometry():
+    map_geometry.build(data_path(MAPPED_OUTPUT))
+
+
+def build_practices():
+    practice_store.build()
+
+
+STAGES = {
+    'median_age': (build_median_age, lambda: [latest(POPULATION_SOURCE)], [MEDIAN_AGE_OUTPUT]),
+    'median_simd': (build_median_simd, lambda: sorted(os.path.basename(f) for f in glob.glob(data_path(SIMD_SOURCE))), [MEDIAN_SIMD_OUTPUT]),
+    'timeseries': (build_timeseries, lambda: [PREVALENCE_SOURCE, BMI_SOURCE, latest(POPULATION_SOURCE), MEDIAN_SIMD_OUTPUT, MEDIAN_AGE_OUTPUT], [TIMESERIES_OUTPUT]),
+    'mapped': (build_mapped, lambda: [TIMESERIES_OUTPUT], [MAPPED_OUTPUT]),
+    'geometry': (build_geometry, lambda: [MAPPED_OUTPUT], map_geometry.outputs()),
+    'practices': (build_practices, practice_store.source_files, [practice_store.index_output()]),
+}
+
+
+# Incremental runner
+
+def load_manifest():
+    if not os.path.exists(MANIFEST):
+        return {}
+    with open(MANIFEST) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def hashes(filenames):
+    return {f: file_hash(data_path(f)) if os.path.exists(data_path(f)) else None for f in filenames}
+
+
+def write_columnar(filename):
+    dataset = datasets.dataset_for(filename)
+    if datasets.pq is None or dataset is None:
+        return
+    pd.read_csv(dataset.csv_path, index_col=dataset.index_col).to_parquet(dataset.columnar_path)
+
+
+def run(stages, force=False, columnar=True):
+    manifest = load_manifest()
+    for name in stages:
+        build, inputs, outputs = STAGES[name]
+        recorded = manifest.get(name, {})
+        state = {'inputs': hashes(inputs()), 'outputs': hashes(outputs)}
+        if not force and state == recorded and None not in state['outputs'].values():
+            print('{:<12} up to date'.format(name))
+            continue
+        start = time.perf_counter()
+        build()
+        if columnar:
+            for output in outputs:
+                write_columnar(output)
+        manifest[name] = {'inputs': hashes(inputs()), 'outputs': hashes(outputs)}
+        save_manifest(manifest)
+        print('{:<12} built in {:.2f}s'.format(name, time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the derived heart health datasets from the raw sources.')
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help='only run the given stage(s)')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the inputs have not changed')
+    parser.add_argument('--no-columnar', dest='columnar', action='store_false', help='skip writing Parquet copies')
+    args = parser.parse_args()
+    run(args.stage or list(STAGES), force=args.force, columnar=args.columnar)
+
+
+if __name__ == '__main__':
+    main()
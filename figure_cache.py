@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Memoised, serialised Plotly figures for callbacks with a small input space.
+#
+# Figures are kept as plain JSON-ready dicts in a bounded in-process LRU, and
+# written as JSON files under FIGURE_CACHE_DIR so every gunicorn worker on the
+# host (and the next deploy's warm-up) can reuse what another worker built.
+# Callers include the dataset version in the key, so a data reload never serves
+# stale figures.
+
+import hashlib
+import json
+import os
+import warnings
+from collections import OrderedDict
+
+import metrics
+import startup
+from datasets import DATA_DIR
+
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', os.path.join(DATA_DIR, '.figure_cache'))
+MEMORY_ENTRIES = 512
+DISK_ENTRIES = 8192
+PRUNE_EVERY = 64
+
+caches = []  # every FigureCache, for the hit rates on /metrics
+
+
+class FigureCache:
+
+    def __init__(self, name, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES, directory=FIGURE_CACHE_DIR):
+        self.name = name
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.directory = os.path.join(directory, name) if directory else None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._entries = OrderedDict()
+        self._lock = startup.fork_safe_lock()
+        self._writes = 0
+        caches.append(self)
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def _remember(self, key, figures):
+        with self._lock:
+            self._entries[key] = figures
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_entries:
+                self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                figures = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return figures
+
+    def _write_disk(self, key, serialized):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        # Write then rename so other workers never read a half-written file
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, 'w') as f:
+                f.write(serialized)
+            os.replace(tmp, path)
+        except OSError as error:
+            # Not retried in this process; the in-memory LRU keeps serving
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            self.directory = None
+            warnings.warn('Could not write to the {} figure cache, keeping figures in memory only: {}'.format(self.name, error))
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        # Least recently used files go first (hits refresh the mtime). Another
+        # worker may remove files between the listing and the stat, or
+        # removing them ourselves, so those are skipped.
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        files = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+        if len(files) <= self.disk_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key, build):
+        """Return the figures for key, calling build() (which returns a list of
+        Plotly figures) only if no worker has built them yet."""
+        key = tuple(key)
+        with self._lock:
+            figures = self._entries.get(key)
+            if figures is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return figures
+        with metrics.phase('data'):
+            figures = self._read_disk(key)
+        if figures is not None:
+            self.stats['disk_hits'] += 1
+        else:
+            from plotly.io.json import to_json_plotly
+            self.stats['misses'] += 1
+            with metrics.phase('figure'):
+                built = build()
+            serialized = '[' + ','.join(to_json_plotly(fig) for fig in built) + ']'
+            self._write_disk(key, serialized)
+            with metrics.phase('serialization'):
+                figures = json.loads(serialized)
+        self._remember(key, figures)
+        return figures
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Batched forecasts for the forecasts page.
+#
+# Every (health board x metric) series in heart_prev_timeseries.csv is fitted in
+# one NumPy pass per method - a linear trend and Holt's linear exponential
+# smoothing - with 95% prediction intervals. Board populations are projected by
+# single year of age from the NRS estimates with the Hamilton-Perry cohort
+# change ratio method. Everything is computed once per dataset version (app.py
+# does it at startup) so the page callbacks only index into arrays.
+
+import numpy as np
+import pandas as pd
+
+import datasets
+
+TIMESERIES = 'heart_prev_timeseries'
+POPULATION = 'population_estimates'
+METRIC_HORIZON = 5
+POPULATION_HORIZON = 10
+METHODS = ('linear', 'holt')
+MIN_HOLT_POINTS = 8  # below this 'auto' always picks the linear trend
+RATIO_YEARS = 5  # transitions averaged for the cohort change ratios
+
+# Holt smoothing parameters tried for every series at once
+HOLT_GRID = np.array([(a, b) for a in np.linspace(0.1, 0.9, 9) for b in np.linspace(0.05, 0.5, 10)])
+
+# Two-sided 95% Student t critical values for 1-30 degrees of freedom
+T95 = np.array([12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042])
+Z95 = 1.96
+
+
+def t95(dof):
+    dof = np.asarray(dof)
+    table = T95[np.clip(dof, 1, len(T95)) - 1]
+    return np.where(dof > len(T95), Z95, np.where(dof >= 1, table, np.nan))
+
+
+# Metric series
+
+def linear_trend(x, y, future):
+    """Least squares line through each row of y (NaN = missing), evaluated at
+    the future x values. Returns forecast, half-width of the 95% interval and
+    the residual sum of squares, one row per series."""
+    observed = ~np.isnan(y)
+    n = observed.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = (observed * x).sum(axis=1) / n
+        y_mean = np.where(observed, y, 0).sum(axis=1) / n
+        dx = np.where(observed, x - x_mean[:, None], 0)
+        dy = np.where(observed, y - y_mean[:, None], 0)
+        sxx = (dx ** 2).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / sxx
+        sse = ((dy - slope[:, None] * dx) ** 2).sum(axis=1)
+        dof = n - 2
+        s = np.sqrt(sse / dof)
+        forecast = y_mean[:, None] + slope[:, None] * (future - x_mean[:, None])
+        spread = np.sqrt(1 + 1 / n[:, None] + (future - x_mean[:, None]) ** 2 / sxx[:, None])
+        half_width = np.where(dof[:, None] > 0, t95(dof)[:, None] * s[:, None] * spread, np.nan)
+    return forecast, half_width, sse
+
+
+def left_align(y):
+    # Drop the gaps in each row and pack the observations to the left
+    observed = ~np.isnan(y)
+    order = np.argsort(~observed, axis=1, kind='stable')
+    return np.take_along_axis(y, order, axis=1), observed.sum(axis=1)
+
+
+def holt(x, y, future):
+    """Holt's linear trend smoothing for every row of y, choosing alpha and beta
+    per series from HOLT_GRID by one-step-ahead squared error. Gaps are
+    skipped, so the series is treated as consecutive observations."""
+    packed, n = left_align(y)
+    last_x = np.where(np.isnan(y), -np.inf, x).max(axis=1)
+    last_x = np.where(n > 0, last_x, x.max())
+    alpha, beta = HOLT_GRID[:, 0][:, None], HOLT_GRID[:, 1][:, None]
+    series = packed.shape[0]
+
+    # State for every (grid point, series) pair
+    level = np.broadcast_to(packed[:, 1], (len(HOLT_GRID), series)).copy()
+    trend = np.broadcast_to(packed[:, 1] - packed[:, 0], (len(HOLT_GRID), series)).copy()
+    sse = np.zeros((len(HOLT_GRID), series))
+    for t in range(2, packed.shape[1]):
+        active = t < n
+        value = np.where(active, packed[:, t], 0)
+        error = value - (level + trend)
+        new_level = level + trend + alpha * error
+        new_trend = trend + alpha * beta * error
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        sse += np.where(active, error ** 2, 0)
+
+    best = sse.argmin(axis=0)
+    pick = lambda a: np.take_along_axis(a, best[None, :], axis=0)[0]
+    level, trend, sse = pick(level), pick(trend), pick(sse)
+    alpha, beta = HOLT_GRID[best, 0], HOLT_GRID[best, 1]
+
+    steps = future[None, :] - last_x[:, None]
+    forecast = level[:, None] + steps * trend[:, None]
+    errors = n - 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = np.where(errors > 0, sse / errors, np.nan)
+        # Forecast variance of the additive Holt model h steps ahead
+        j = np.arange(1, steps.max() if steps.size else 1)
+        terms = (alpha[:, None] * (1 + j[None, :] * beta[:, None])) ** 2
+        cumulative = np.concatenate([np.zeros((series, 1)), np.cumsum(terms, axis=1)], axis=1)
+        h = np.clip(steps.astype(int) - 1, 0, cumulative.shape[1] - 1)
+        variance = sigma2[:, None] * (1 + np.take_along_axis(cumulative, h, axis=1))
+        half_width = Z95 * np.sqrt(variance)
+    valid = (n >= 2)[:, None]
+    return np.where(valid, forecast, np.nan), np.where(valid, half_width, np.nan), sse, n
+
+
+class MetricForecasts:
+
+    def __init__(self, df):
+        self.metrics = list(df.columns[2:14])
+        self.boards, self.years, values = datasets.cube(TIMESERIES, self.metrics)
+        self.future = np.arange(self.years[-1] + 1, self.years[-1] + 1 + METRIC_HORIZON)
+
+        # (board, metric, year) cube, flattened to one row per series
+        values = values.transpose(0, 2, 1)
+        self.history = values
+        series = values.reshape(-1, len(self.years))
+
+        x = self.years.astype(float)
+        linear, linear_width, linear_sse = linear_trend(x[None, :], series, self.future.astype(float))
+        holt_forecast, holt_width, holt_sse, n = holt(x[None, :], series, self.future.astype(float))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tiny = np.finfo(float).tiny
+            linear_aic = n * np.log(np.maximum(linear_sse, tiny) / n) + 4
+            holt_aic = (n - 2) * np.log(np.maximum(holt_sse, tiny) / (n - 2)) + 8
+        use_holt = (n >= MIN_HOLT_POINTS) & (holt_aic < linear_aic)
+
+        shape = (len(self.boards), len(self.metrics), len(self.future))
+        self.forecast = {'linear': linear.reshape(shape), 'holt': holt_forecast.reshape(shape)}
+        self.half_width = {'linear': linear_width.reshape(shape), 'holt': holt_width.reshape(shape)}
+        self.auto = np.where(use_holt, 'holt', 'linear').reshape(shape[:2])
+
+    def series(self, board, metric, method='auto'):
+        b, m = self.boards.index(board), self.metrics.index(metric)
+        if method == 'auto':
+            method = str(self.auto[b, m])
+        forecast, half_width = self.forecast[method][b, m], self.half_width[method][b, m]
+        return {
+            'method': method,
+            'years': self.years,
+            'values': self.history[b, m],
+            'forecast_years': self.future,
+            'forecast': forecast,
+            'lower': forecast - half_width,
+            'upper': forecast + half_width,
+        }
+
+
+# Population
+
+def age_summary(counts):
+    # Median and mean age from single-year-of-age counts along the last axis
+    total = counts.sum(axis=-1)
+    ages = np.arange(counts.shape[-1])
+    median = (counts.cumsum(axis=-1) >= total[..., None] / 2).argmax(axis=-1)
+    return total, median, counts @ ages / total
+
+
+class PopulationProjection:
+
+    def __init__(self, df):
+        persons = df.loc[df['Sex'] == 'Persons']
+        ages = [str(a) for a in range(91)]
+        self.boards = sorted(persons['Area name'].unique())
+        self.years = np.array(sorted(persons['Year'].unique()))
+        self.future = np.arange(self.years[-1] + 1, self.years[-1] + 1 + POPULATION_HORIZON)
+
+        persons = persons.set_index(['Area name', 'Year']).reindex(pd.MultiIndex.from_product([self.boards, self.years]))
+        counts = persons[ages].to_numpy(dtype=float).reshape(len(self.boards), len(self.years), len(ages))
+        self.history = counts
+
+        # Cohort change ratios from the last RATIO_YEARS transitions, all boards at once
+        recent = counts[:, -(RATIO_YEARS + 1):]
+        before, after = recent[:, :-1].sum(axis=1), recent[:, 1:].sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratios = np.ones_like(before)
+            ratios[:, 1:90] = after[:, 1:90] / before[:, 0:89]
+            ratios[:, 90] = after[:, 90] / (before[:, 89] + before[:, 90])
+            # Births are not in the estimates, so age 0 follows the 15-44 population
+            ratios[:, 0] = after[:, 0] / before[:, 15:45].sum(axis=1)
+        ratios = np.nan_to_num(ratios)
+
+        projected = np.empty((len(self.boards), len(self.future), len(ages)))
+        current = counts[:, -1]
+        for h in range(len(self.future)):
+            following = np.empty_like(current)
+            following[:, 0] = ratios[:, 0] * current[:, 15:45].sum(axis=1)
+            following[:, 1:90] = ratios[:, 1:90] * current[:, 0:89]
+            following[:, 90] = ratios[:, 90] * (current[:, 89] + current[:, 90])
+            projected[:, h] = following
+            current = following
+        self.projected = projected
+
+        self.history_total, self.history_median, self.history_mean = age_summary(counts)
+        self.projected_total, self.projected_median, self.projected_mean = age_summary(projected)
+
+    def series(self, board):
+        b = self.boards.index(board)
+        return {
+            'years': self.years,
+            'total': self.history_total[b],
+            'median_age': self.history_median[b],
+            'mean_age': self.history_mean[b],
+            'forecast_years': self.future,
+            'forecast_total': self.projected_total[b],
+            'forecast_median_age': self.projected_median[b],
+            'forecast_mean_age': self.projected_mean[b],
+        }
+
+
+# Cached per dataset version
+
+def metrics():
+    return datasets.derived(TIMESERIES, 'forecasts', MetricForecasts)
+
+
+def population():
+    return datasets.derived(POPULATION, 'projection', PopulationProjection)
+
+
+def precompute():
+    metrics()
+    population()
@@ -0,0 +1,19 @@
+# gunicorn app:server
+
+import gc
+
+# Build the app (and load the datasets) once in the master, then fork
+preload_app = True
+
+
+def when_ready(server):
+    # Pull in the imports the callbacks would otherwise each make on first use
+    import startup
+    startup.import_deferred()
+    startup.report()
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from touching (and so copying) the pages that
+    # hold the preloaded data in every worker
+    gc.freeze()
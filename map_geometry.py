@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Simplified health board boundaries for the native choropleth on the map page.
+#
+# etl.py calls build() to turn the full-resolution WKT in heart_prev_mapped.csv
+# into compact GeoJSON at a few simplification levels; available() builds them
+# on first use when etl.py has not been run. The files are served by
+# register_routes() with an ETag and gzip, and the choropleth references them
+# by URL so the shapes never travel inside the page layout or callback
+# responses. The URL carries the file's content hash, so a rebuilt file gets a
+# new URL and each version can be cached as immutable.
+
+import gzip
+import hashlib
+import json
+import os
+import warnings
+
+import startup
+from datasets import DATA_DIR
+
+GEOMETRY_DIR = os.path.join(DATA_DIR, 'geometry')
+MAPPED_CSV = os.path.join(DATA_DIR, 'heart_prev_mapped.csv')
+ROUTE = '/map-assets/'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# For requests without the current version, e.g. from a page built before a rebuild
+REVALIDATE = 'no-cache'
+
+# Simplification tolerance in metres (the source WKT is British National Grid)
+# and the decimal places kept in WGS84 (4 is ~10 m, 3 is ~100 m) for each level
+LEVELS = {'high': (100, 4), 'medium': (500, 3), 'low': (2000, 3)}
+DEFAULT_LEVEL = 'medium'
+
+# Files outside GEOMETRY_DIR that may be served from ROUTE
+EXTRA_FILES = {'heartprevmap.html': os.path.join(DATA_DIR, 'heartprevmap.html')}
+
+
+def geometry_filename(level=DEFAULT_LEVEL):
+    return 'boards_{}.geojson'.format(level)
+
+
+def asset_url(filename):
+    asset = _load(filename)
+    if asset is None:
+        return ROUTE + filename
+    return '{}{}?v={}'.format(ROUTE, filename, asset.etag)
+
+
+# Offline build
+
+def _round_coordinates(coordinates, decimals):
+    if isinstance(coordinates[0], (int, float)):
+        return [round(c, decimals) for c in coordinates[:2]]
+    return [_round_coordinates(c, decimals) for c in coordinates]
+
+
+def build(mapped_csv):
+    import numpy as np
+    import pandas as pd
+    import shapely
+    from pyproj import Transformer
+
+    boards = pd.read_csv(mapped_csv, usecols=['HBCode', 'HBName', 'geometry'])
+    shapes = shapely.from_wkt(boards['geometry'].to_numpy())
+    to_wgs84 = Transformer.from_crs('EPSG:27700', 'EPSG:4326', always_xy=True)
+
+    os.makedirs(GEOMETRY_DIR, exist_ok=True)
+    for level, (tolerance, decimals) in LEVELS.items():
+        # Simplifying the boards as one coverage keeps shared borders identical,
+        # so neighbouring boards don't open gaps or overlap each other
+        if hasattr(shapely, 'coverage_simplify'):
+            simplified = shapely.coverage_simplify(shapes, tolerance)
+        else:
+            simplified = shapely.simplify(shapes, tolerance, preserve_topology=True)
+        simplified = shapely.transform(simplified, lambda xy: np.column_stack(to_wgs84.transform(xy[:, 0], xy[:, 1])))
+        features = [
+            {
+                'type': 'Feature',
+                'id': code,
+                'properties': {'HBCode': code, 'HBName': name},
+                'geometry': {'type': geom['type'], 'coordinates': _round_coordinates(geom['coordinates'], decimals)},
+            }
+            for code, name, geom in zip(boards['HBCode'], boards['HBName'], (shape.__geo_interface__ for shape in simplified))
+        ]
+        # Written aside and renamed, so another worker never serves half a file
+        path = os.path.join(GEOMETRY_DIR, geometry_filename(level))
+        staging = '{}.tmp-{}'.format(path, os.getpid())
+        with open(staging, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, separators=(',', ':'))
+        os.replace(staging, path)
+
+
+def outputs():
+    return [os.path.join('geometry', geometry_filename(level)) for level in LEVELS]
+
+
+_build_lock = startup.fork_safe_lock()
+_build_failed = False
+
+
+def available(level=DEFAULT_LEVEL):
+    """Whether the GeoJSON for level is on disk, building it on first use if
+    etl.py has never been run. False without shapely and pyproj or when
+    GEOMETRY_DIR can't be written, so the map page can fall back to folium."""
+    global _build_failed
+    path = os.path.join(GEOMETRY_DIR, geometry_filename(level))
+    if os.path.exists(path):
+        return True
+    with _build_lock:
+        if not _build_failed and not os.path.exists(path):
+            try:
+                build(MAPPED_CSV)
+            except (ImportError, OSError) as error:
+                # Not retried in this process; etl.py --stage geometry can still build it
+                _build_failed = True
+                warnings.warn('Could not build the map geometry, falling back to the folium map: {}'.format(error))
+    return os.path.exists(path)
+
+
+# Serving
+
+class StaticAsset:
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.mtime = os.stat(path).st_mtime_ns
+        self.gzipped = gzip.compress(self.body, compresslevel=9)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+_assets = {}
+
+
+def _asset_path(filename):
+    if filename in EXTRA_FILES:
+        return EXTRA_FILES[filename]
+    if os.path.basename(filename) != filename or not filename.endswith('.geojson'):
+        return None
+    return os.path.join(GEOMETRY_DIR, filename)
+
+
+def _load(filename):
+    path = _asset_path(filename)
+    if path is None or not os.path.exists(path):
+        return None
+    asset = _assets.get(filename)
+    if asset is None or asset.mtime != os.stat(path).st_mtime_ns:
+        asset = _assets[filename] = StaticAsset(path)
+    return asset
+
+
+def _mimetype(filename):
+    return 'text/html' if filename.endswith('.html') else 'application/geo+json'
+
+
+def register_routes(server):
+    from flask import Response, abort, request
+
+    @server.route(ROUTE + '<filename>')
+    def map_asset(filename):
+        asset = _load(filename)
+        if asset is None:
+            abort(404)
+        cache_control = CACHE_CONTROL if request.args.get('v') == asset.etag else REVALIDATE
+        headers = {'ETag': '"{}"'.format(asset.etag), 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if asset.etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+        body = asset.body
+        if 'gzip' in request.accept_encodings:
+            body = asset.gzipped
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, mimetype=_mimetype(filename), headers=headers)
+
+
+# Figure
+
+def choropleth(df, metric, level=DEFAULT_LEVEL):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Choropleth(
+        geojson=asset_url(geometry_filename(level)),
+        featureidkey='properties.HBCode',
+        locations=list(df.index),
+        z=df[metric].tolist(),
+        text=df['HBName'].tolist(),
+        hovertemplate='%{text}<br>%{z}<extra></extra>',
+        colorscale='RdPu',
+        colorbar={'title': {'text': metric}},
+        marker={'line': {'color': 'white', 'width': 0.5}},
+    ))
+    fig.update_geos(fitbounds='locations', visible=False)
+    fig.update_layout(margin={'l': 0, 'r': 0, 't': 0, 'b': 0}, height=600)
+    return fig
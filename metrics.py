@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Request metrics for the dashboard, served in the Prometheus text format at
+# METRICS_ROUTE.
+#
+# Every request is timed. Dash callbacks are labelled by their output and split
+# into the time spent on data access, figure construction and serialization,
+# which the code doing that work marks with phase(); whatever is left is
+# 'other'. Page layout requests, dataset loads and reloads, cache hit rates and
+# the response sizes recorded by payloads.py are reported alongside. Callback
+# outputs and pages the app doesn't have are labelled 'unknown', so clients
+# can't add series. Metrics are kept per process, so under gunicorn each worker
+# reports its own.
+#
+# Set PROFILE_SLOW_REQUESTS_MS to sample the stack of every thread serving a
+# request each PROFILE_INTERVAL_MS and write the folded stacks of any request
+# slower than that to PROFILE_DIR, ready for flamegraph.pl or speedscope. With
+# it unset nothing is sampled and the cost per request is a few microseconds.
+
+import bisect
+import collections
+import contextlib
+import os
+import re
+import sys
+import threading
+import time
+
+import startup
+
+METRICS_ROUTE = '/metrics'
+PREFIX = 'heart_'
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ('data', 'figure', 'serialization')
+
+PROFILE_THRESHOLD_MS = os.environ.get('PROFILE_SLOW_REQUESTS_MS')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.profiles'))
+
+_lock = startup.fork_safe_lock()
+_local = threading.local()
+
+
+# Metric types
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('{}="{}"'.format(n, escape(v)) for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = PREFIX + name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with _lock:
+            values = sorted(self._values.items())
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        lines += ['{}{} {}'.format(self.name, _labels(self.labels, k), v) for k, v in values]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name, self.help, self.labels, self.buckets = PREFIX + name, help, tuple(labels), buckets
+        self._series = {}
+
+    def observe(self, value, *labels):
+        with _lock:
+            series = self._series.get(labels)
+            if series is None:
+                # One count per bucket (the last is +Inf), then the sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        with _lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        names = self.labels + ('le',)
+        for key, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name, _labels(names, key + (bound,)), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, key), counts[-1]))
+            lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, key), cumulative))
+        return lines
+
+
+requests = Histogram('http_request_duration_seconds', 'Time to serve a request, by route.', ['endpoint'])
+callbacks = Histogram('dash_callback_duration_seconds', 'Time to run a Dash callback, by output.', ['callback'])
+callback_phases = Histogram('dash_callback_phase_seconds', 'Time spent in each phase of a Dash callback.', ['callback', 'phase'])
+layouts = Histogram('page_layout_duration_seconds', 'Time to build and send a page layout, by page.', ['page'])
+dataset_loads = Histogram('dataset_load_seconds', 'Time to read and index a dataset.', ['dataset', 'kind'])
+profiles = Counter('slow_request_profiles_total', 'Flame graph profiles written for slow requests.', ['endpoint'])
+METRICS = [requests, callbacks, callback_phases, layouts, dataset_loads, profiles]
+
+
+def dataset_loaded(name, seconds, reload=False):
+    dataset_loads.observe(seconds, name, 'reload' if reload else 'load')
+
+
+# Phases
+
+@contextlib.contextmanager
+def phase(name):
+    """Count the time spent in the block towards phase name of the current
+    request. Phases nest; the time in an inner phase is taken out of the
+    outer one."""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        yield
+        return
+    now = time.perf_counter()
+    if stack:
+        outer = stack[-1]
+        _local.phases[outer[0]] = _local.phases.get(outer[0], 0) + now - outer[1]
+    stack.append([name, now])
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        name, since = stack.pop()
+        _local.phases[name] = _local.phases.get(name, 0) + end - since
+        if stack:
+            stack[-1][1] = end
+
+
+def instrument_serialization():
+    # Dash and figure_cache both encode through plotly's to_json_plotly, and
+    # look it up on the module at call time
+    import plotly.io.json
+
+    to_json_plotly = plotly.io.json.to_json_plotly
+    if getattr(to_json_plotly, 'instrumented', False):
+        return
+
+    def timed_to_json_plotly(*args, **kwargs):
+        with phase('serialization'):
+            return to_json_plotly(*args, **kwargs)
+
+    timed_to_json_plotly.instrumented = True
+    plotly.io.json.to_json_plotly = timed_to_json_plotly
+
+
+# Slow request profiler
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+
+    def __init__(self, threshold_ms, interval_ms=PROFILE_INTERVAL_MS, directory=PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self._active = {}
+        self._thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._active = {}
+        self._thread = None
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, stacks in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+
+    def begin(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+        self._active[threading.get_ident()] = collections.Counter()
+
+    def end(self, endpoint, seconds):
+        stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or seconds < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', endpoint).strip('-')[:80]
+        path = os.path.join(self.directory, '{}-{}-{:.0f}ms-{}.folded'.format(time.strftime('%Y%m%dT%H%M%S'), os.getpid(), seconds * 1000, slug))
+        with open(path, 'w') as f:
+            f.writelines('{} {}\n'.format(stack, count) for stack, count in stacks.most_common())
+        profiles.inc(endpoint)
+        return path
+
+
+profiler = SlowRequestProfiler(float(PROFILE_THRESHOLD_MS)) if PROFILE_THRESHOLD_MS else None
+
+
+# Values owned by other modules, read when scraped
+
+def _family(name, kind, help, labels, samples):
+    name = PREFIX + name
+    lines = ['# HELP {} {}'.format(name, help), '# TYPE {} {}'.format(name, kind)]
+    return lines + ['{}{} {}'.format(name, _labels(labels, key), value) for key, value in samples]
+
+
+def _collected():
+    import figure_cache
+    import payloads
+    import practice_store
+
+    lines = _family('figure_cache_requests_total', 'counter', 'Figure cache lookups by result.', ['cache', 'result'],
+                    [((cache.name, result), count) for cache in figure_cache.caches for result, count in sorted(cache.stats.items())])
+    current = practice_store._store
+    lines += _family('practice_store_queries_total', 'counter', 'Practice grid queries by result.', ['result'],
+                     [((result,), count) for result, count in sorted(current.stats.items())] if current is not None else [])
+    sizes = payloads.report()
+    lines += _family('responses_total', 'counter', 'Responses recorded by payloads.py, by endpoint.', ['endpoint'],
+                     [((name,), entry['count']) for name, entry in sizes.items()])
+    lines += _family('response_bytes_total', 'counter', 'Response bytes before (raw) and after (sent) compression, by endpoint.', ['endpoint', 'stage'],
+                     [((name, stage), entry[stage + '_bytes']) for name, entry in sizes.items() for stage in ('raw', 'sent')])
+    return lines
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _collected()
+    return '\n'.join(lines) + '\n'
+
+
+# Flask hooks
+
+def _callback_labels(request):
+    # The callback output, and for the page router the page being laid out.
+    # Both come from the client, so anything that is not one of the app's
+    # callbacks or pages is labelled unknown and can't add series.
+    import dash
+    import payloads
+
+    output = payloads.callback_output(request)
+    page = None
+    if '_pages_content' in output:
+        inputs = request.get_json(silent=True).get('inputs')
+        pathname = next((i.get('value') for i in inputs if isinstance(i, dict) and i.get('property') == 'pathname'), None) if isinstance(inputs, list) else None
+        page = pathname if pathname in {p['relative_path'] for p in dash.page_registry.values()} else payloads.UNKNOWN
+    return output, page
+
+
+def register(server):
+    # Call after payloads.register(), so the hook inserted at the front runs
+    # last and the time includes compression
+    from flask import Response, g, request
+
+    def start():
+        g.metrics_start = time.perf_counter()
+        _local.phases, _local.stack = {}, []
+        if profiler is not None:
+            profiler.begin()
+
+    def finish(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        requests.observe(elapsed, endpoint)
+        if request.path.endswith('/_dash-update-component'):
+            output, page = _callback_labels(request)
+            callbacks.observe(elapsed, output)
+            spent = _local.phases or {}
+            for name in PHASES:
+                callback_phases.observe(spent.get(name, 0), output, name)
+            callback_phases.observe(max(elapsed - sum(spent.values()), 0), output, 'other')
+            if page is not None:
+                layouts.observe(elapsed, page)
+            endpoint = 'callback ' + output
+        elif endpoint == '/_dash-layout':
+            layouts.observe(elapsed, endpoint)
+        if profiler is not None:
+            profiler.end(endpoint, elapsed)
+        return response
+
+    def clear(exception=None):
+        _local.phases = _local.stack = None
+        if profiler is not None:
+            profiler._active.pop(threading.get_ident(), None)
+
+    server.before_request(start)
+    server.after_request_funcs.setdefault(None, []).insert(0, finish)
+    server.teardown_request(clear)
+    instrument_serialization()
+
+    @server.route(METRICS_ROUTE)
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Import packages/libraries
+
+# In[1]:
+
+
+import dash
+from dash import Dash, dcc, html, callback, Input, Output
+import dash_bootstrap_components as dbc
+
+import correlation_engine
+import correlation_figures
+
+dash.register_page(__name__)
+
+# Every correlation matrix is precomputed by correlation_engine.py
+
+
+# Create layout
+
+# In[2]:
+
+def layout(**kwargs):
+    matrices = correlation_engine.matrices()
+    return dbc.Container([
+        html.H1("Correlation Matrix of Heart Disease Related factors in Scottish Health Boards 2022-2025", className='mb-2', style={'textAlign':'center'}),
+        html.Summary("The heatmap below shows the correlation between every pair of heart disease related factors from Public Health Scotland (PHS), National Records of Scotland and the Scottish Government. Compare the health boards with each other in a single year, or follow one health board over 2022-2025, using either Pearson (linear) or Spearman (rank) correlation:", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        dbc.Row([dbc.Col([dcc.RadioItems(id='matrix-scope', value=correlation_engine.ACROSS_BOARDS, inline=True, inputStyle={'margin': '0 5px 0 15px'},
+                                         options=[{'label': 'Across health boards', 'value': correlation_engine.ACROSS_BOARDS}, {'label': 'Within a health board over time', 'value': correlation_engine.WITHIN_BOARD}])], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.RadioItems(id='matrix-method', value='pearson', inline=True, inputStyle={'margin': '0 5px 0 15px'},
+                                         options=[{'label': 'Pearson', 'value': 'pearson'}, {'label': 'Spearman', 'value': 'spearman'}])], style={'margin-top': '1em', 'padding': '10px 10px'})]),
+        dbc.Row([dbc.Col([dcc.Dropdown(id='matrix-year', value=int(matrices.years[-2]), clearable=False, options=[int(y) for y in matrices.years])], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.Dropdown(id='matrix-healthboard', value='Ayrshire and Arran', clearable=False, disabled=True, options=matrices.boards)], style={'margin-top': '1em', 'padding': '10px 10px'})]),
+        dbc.Row([dbc.Col([dcc.Graph(id='matrix-graph-plotly', figure={}, style={'width': '120vh', 'height': '120vh', 'textAlign':'center'})])]),
+        html.H4("Reading the Matrix", className='mb-2', style={'margin-top': '1em', 'padding': '10px 10px', 'textAlign': 'center'}),
+        html.Summary("Red cells show factors that rise together and blue cells factors that move in opposite directions. Hover over a cell to see the p-value, the share of random reorderings of the health boards (or years) that correlate at least as strongly, and n, the number of health boards (or years) with data for both factors. Within a single health board there are only four years of data (three where the age or SIMD data are involved), so there are only 24 (or 6) orderings to compare against: even a perfect correlation has a p-value of at least 0.042 (0.167) for Pearson, and for Spearman, where the reversed order is just as strong, 0.083 (0.333). Blank cells have fewer than three shared data points; the age and SIMD data have not been updated for 2025 as yet.", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        html.H4("Open Data References", className='mb-2', style={'margin-top': '1em', 'padding': '10px 10px', 'textAlign': 'center'}),
+        html.Summary("Public Health Scotland", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://publichealthscotland.scot/publications/general-practice-disease-prevalence-data-visualisation/general-practice-disease-prevalence-visualisation-8-july-2025/")),
+        html.Li(html.Cite("https://www.opendata.nhs.scot/dataset/01fe4008-23f8-4b34-b8f6-c38699a2f00d/resource/2cb9d907-7149-4bbd-904a-174f15344585/download/od_p1bmi_hb_epi.csv")),
+        html.Summary("National Records of Scotland", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://www.nrscotland.gov.uk/publications/population-estimates-time-series-data/")),
+        html.Summary("Scottish Government", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://www.gov.scot/publications/scottish-surveys-core-questions-2023/"))
+    ])
+
+@callback(
+    Output('matrix-graph-plotly', 'figure'),
+    Output('matrix-year', 'disabled'),
+    Output('matrix-healthboard', 'disabled'),
+    Input('matrix-scope', 'value'),
+    Input('matrix-method', 'value'),
+    Input('matrix-year', 'value'),
+    Input('matrix-healthboard', 'value')
+)
+
+def plot_data(scope, method, year, healthboard):
+
+    # Look up the precomputed matrix for the selected year or health board
+    across_boards = scope == correlation_engine.ACROSS_BOARDS
+    fig_matrix = correlation_figures.matrix(method, scope, year if across_boards else healthboard)
+
+    return fig_matrix, not across_boards, across_boards
@@ -1 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
 
+# Import libraries/packages
+
+# In[1]:
+
+
+import dash
+from dash import Dash, dcc, html, callback, Input, Output
+import dash_bootstrap_components as dbc
+
+import forecasting
+import metrics
+
+dash.register_page(__name__)
+
+# Forecasts are precomputed for every health board and factor by forecasting.py
+
+# In[2]:
+
+def layout(**kwargs):
+    metric_forecasts = forecasting.metrics()
+    return dbc.Container([
+        html.H1("Forecasts of Heart Disease Related factors in Scottish Health Boards", className='mb-2', style={'textAlign':'center'}),
+        html.Summary("The graphs below project the heart disease related factors from Public Health Scotland (PHS), National Records of Scotland and the Scottish Government forward five years for each of the Scottish Health Board Regions, together with a ten year projection of each region's population by age. Choose a health board, a heart disease related factor and a forecasting method from the lists below:", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        dbc.Row([dbc.Col([dcc.Dropdown(id='forecast-healthboard', value='Ayrshire and Arran', clearable=False, options=metric_forecasts.boards)], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.Dropdown(id='forecast-category', value='Rate_Coronary Heart Disease (CHD)', clearable=False, options=metric_forecasts.metrics)], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.RadioItems(id='forecast-method', value='auto', inline=True, inputStyle={'margin': '0 5px 0 15px'},
+                                         options=[{'label': 'Best fit', 'value': 'auto'}, {'label': 'Linear trend', 'value': 'linear'}, {'label': 'Holt smoothing', 'value': 'holt'}])], style={'margin-top': '1em', 'padding': '10px 10px'})]),
+        dbc.Row([dbc.Col([dcc.Graph(id='forecast-graph-plotly', figure={}, style={'width': '120vh', 'height': '90vh', 'textAlign':'center'})])]),
+        html.H4("Reading the Forecasts", className='mb-2', style={'margin-top': '1em', 'padding': '10px 10px', 'textAlign': 'center'}),
+        html.Summary("The shaded band is the 95% prediction interval. Most factors only have three or four years of data, so the intervals are wide and the forecasts should be read as a continuation of the recent trend rather than a prediction. No band is shown where there are too few years to estimate one.", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        html.Summary("The population projection carries each single year of age forward using the average change in each age group over the last five years of National Records of Scotland estimates, so it assumes recent births, deaths and migration continue.", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        dbc.Row([dbc.Col([dcc.Graph(id='population-graph-plotly', figure={}, style={'width': '120vh', 'height': '90vh', 'textAlign':'center'})])]),
+        html.H4("Open Data References", className='mb-2', style={'margin-top': '1em', 'padding': '10px 10px', 'textAlign': 'center'}),
+        html.Summary("Public Health Scotland", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://publichealthscotland.scot/publications/general-practice-disease-prevalence-data-visualisation/general-practice-disease-prevalence-visualisation-8-july-2025/")),
+        html.Li(html.Cite("https://www.opendata.nhs.scot/dataset/01fe4008-23f8-4b34-b8f6-c38699a2f00d/resource/2cb9d907-7149-4bbd-904a-174f15344585/download/od_p1bmi_hb_epi.csv")),
+        html.Summary("National Records of Scotland", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://www.nrscotland.gov.uk/publications/population-estimates-time-series-data/")),
+        html.Summary("Scottish Government", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://www.gov.scot/publications/scottish-surveys-core-questions-2023/"))
+    ])
+
+@callback(
+    Output('forecast-graph-plotly', 'figure'),
+    Output('population-graph-plotly', 'figure'),
+    Input('forecast-healthboard', 'value'),
+    Input('forecast-category', 'value'),
+    Input('forecast-method', 'value')
+)
+
+def plot_data(healthboard, selected_yaxis, method):
+    import plotly.graph_objects as go
+
+    # Look up the precomputed forecasts
+    metric = forecasting.metrics().series(healthboard, selected_yaxis, method)
+    population = forecasting.population().series(healthboard)
+
+    # Build the Plotly figures
+    with metrics.phase('figure'):
+        fig_forecast = go.Figure([
+            go.Scatter(x=list(metric['forecast_years']) + list(metric['forecast_years'][::-1]), y=list(metric['upper']) + list(metric['lower'][::-1]),
+                       fill='toself', fillcolor='rgba(170, 51, 106, 0.2)', line={'width': 0}, hoverinfo='skip', name='95% prediction interval'),
+            go.Scatter(x=metric['years'], y=metric['values'], mode='lines+markers', name='Recorded'),
+            go.Scatter(x=metric['forecast_years'], y=metric['forecast'], mode='lines+markers', line={'dash': 'dash'}, name='Forecast ({})'.format(metric['method'])),
+        ])
+        fig_forecast.update_layout(title="Figure 1: Forecast of "+selected_yaxis+" in "+healthboard, xaxis_title='Year', yaxis_title=selected_yaxis, legend=dict(yanchor='middle', y=0.5))
+        fig_forecast.update_xaxes(tickangle=330, automargin=True, dtick=1)
+
+        fig_population = go.Figure([
+            go.Scatter(x=population['years'], y=population['total'], mode='lines', name='Population estimate'),
+            go.Scatter(x=population['forecast_years'], y=population['forecast_total'], mode='lines', line={'dash': 'dash'}, name='Population projection'),
+            go.Scatter(x=population['years'], y=population['median_age'], mode='lines', name='Median age', yaxis='y2'),
+            go.Scatter(x=population['forecast_years'], y=population['forecast_median_age'], mode='lines', line={'dash': 'dash'}, name='Projected median age', yaxis='y2'),
+        ])
+        fig_population.update_layout(title="Figure 2: Population projection for "+healthboard, xaxis_title='Year', yaxis_title='Population',
+                                     yaxis2=dict(title='Median age', overlaying='y', side='right'), legend=dict(yanchor='middle', y=0.5, x=1.08))
+        fig_population.update_xaxes(tickangle=330, automargin=True)
+
+    return fig_forecast, fig_population
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Import libraries/packages
+
+# In[1]:
+
+
+import dash
+from dash import Dash, dcc, html, callback, Input, Output, State
+import dash_ag_grid as dag
+import dash_bootstrap_components as dbc
+
+import practice_store
+
+dash.register_page(__name__)
+
+# The grid pages through the indexed store built by practice_store.py, so only
+# the rows on screen are sent to the browser
+
+# In[2]:
+
+
+ROW_COLUMNS = [practice_store.BOARD_COLUMN, practice_store.YEAR_COLUMN, practice_store.AREA_COLUMN, 'PracticeCode', 'AreaType', 'Age', 'Sex']
+DEFAULT_METRICS = ['Rate_Atrial Fibrillation', 'Rate_Coronary Heart Disease (CHD)', 'Rate_Heart Failure', 'Rate_Hypertension']
+BLOCK_SIZE = 100
+
+def column_defs(metrics):
+    number = {'filter': 'agNumberColumnFilter'}
+    text = {'filter': 'agTextColumnFilter'}
+    return ([dict({'field': c}, **(number if c == practice_store.YEAR_COLUMN else text)) for c in ROW_COLUMNS] +
+            [dict({'field': c}, **number) for c in metrics or []])
+
+def board_filter(healthboard, year):
+    return {practice_store.BOARD_COLUMN: {'filterType': 'text', 'type': 'equals', 'filter': healthboard},
+            practice_store.YEAR_COLUMN: {'filterType': 'number', 'type': 'equals', 'filter': year}}
+
+def metric_columns(store):
+    return [c for c in (store.columns if store else []) if c.startswith(('Rate_', 'PatientCount_'))]
+
+def grid(store):
+    if store is None:
+        return html.Summary("The GP practice data has not been built yet. Run python etl.py --stage practices to build it.", style={'textAlign': 'center', 'list-style': 'none'})
+    return dag.AgGrid(id='practice-grid', rowModelType='infinite', columnDefs=column_defs(DEFAULT_METRICS), columnSize='autoSize',
+                      filterModel=board_filter('Ayrshire and Arran', store.years[-1]),
+                      defaultColDef={'sortable': True, 'resizable': True, 'filterParams': {'maxNumConditions': 2}},
+                      dashGridOptions={'rowBuffer': 0, 'cacheBlockSize': BLOCK_SIZE, 'maxBlocksInCache': 10, 'infiniteInitialRowCount': 1,
+                                       'pagination': True, 'paginationPageSize': BLOCK_SIZE})
+
+
+def layout(**kwargs):
+    store = practice_store.store()
+    return dbc.Container([
+        html.H1("GP Practice Prevalence of Heart Disease Related factors in Scottish Health Boards", className='mb-2', style={'textAlign':'center'}),
+        html.Summary("The grid below drills down into the Public Health Scotland (PHS) general practice disease prevalence data by health board, year, GP practice, age group and sex. Choose a health board, a year and the factors that you are interested in from the lists below, then sort or filter any column in the grid:", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        dbc.Row([dbc.Col([dcc.Dropdown(id='practice-healthboard', value='Ayrshire and Arran', clearable=False, options=store.boards if store else [])], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.Dropdown(id='practice-year', value=store.years[-1] if store else None, clearable=False, options=store.years if store else [])], style={'margin-top': '1em', 'padding': '10px 10px'}),
+                 dbc.Col([dcc.Dropdown(id='practice-category', value=DEFAULT_METRICS, multi=True, options=metric_columns(store))], style={'margin-top': '1em', 'padding': '10px 10px'})]),
+        html.Figcaption("Table 1: Prevalence of disease by GP practice, age group and sex", className='mb-2', style={'margin-bottom': '1em', 'padding': '10px 10px', 'textAlign':'center'}),
+        dbc.Row([dbc.Col([grid(store)])]),
+        html.Summary("The published extract in this repository only has health board totals by age group, so each board appears as a single area. Practice-level extracts added alongside it are picked up the next time the data is rebuilt.", className='mb-2', style={'textAlign':'center', 'list-style': 'none', 'margin-top': '1em', 'padding': '10px 10px'}),
+        html.H4("Open Data References", className='mb-2', style={'margin-top': '1em', 'padding': '10px 10px', 'textAlign': 'center'}),
+        html.Summary("Public Health Scotland", style={'list-style': 'none'}),
+        html.Li(html.Cite("https://publichealthscotland.scot/publications/general-practice-disease-prevalence-data-visualisation/general-practice-disease-prevalence-visualisation-8-july-2025/")),
+        html.Li(html.Cite("https://publichealthscotland.scot/media/34174/diseaseprevalence_methodology_and_metadata_2025-for-publication.pdf"))
+    ])
+
+@callback(
+    Output('practice-grid', 'filterModel'),
+    Input('practice-healthboard', 'value'),
+    Input('practice-year', 'value'),
+    State('practice-grid', 'filterModel')
+)
+
+def select_partition(healthboard, year, filter_model):
+
+    # Keep any column filters set in the grid and replace the board and year
+    return dict(filter_model or {}, **board_filter(healthboard, year))
+
+@callback(
+    Output('practice-grid', 'columnDefs'),
+    Input('practice-category', 'value')
+)
+
+def select_columns(selected_metrics):
+    return column_defs(selected_metrics)
+
+@callback(
+    Output('practice-grid', 'getRowsResponse'),
+    Input('practice-grid', 'getRowsRequest'),
+    State('practice-grid', 'columnDefs')
+)
+
+def get_rows(request, columns):
+    store = practice_store.store()
+    if request is None or store is None:
+        return dash.no_update
+
+    # Sort, filter and slice on the server, against the current store
+    rows, count = store.page(request['startRow'], request['endRow'], [c['field'] for c in columns],
+                             request.get('filterModel'), request.get('sortModel'))
+    return {'rowData': rows, 'rowCount': count}
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Per-endpoint response size report.
+#
+# Records, for every endpoint, how many bytes each response had before
+# compression and how many were actually sent, and serves the totals as JSON at
+# REPORT_ROUTE. Dash callbacks are reported per callback output, so each
+# interaction on a page has its own line. The output is named by the client, so
+# only the app's own callbacks get a line and anything else counts as UNKNOWN.
+
+import threading
+
+REPORT_ROUTE = '/_payload-report'
+UNKNOWN = 'unknown'
+
+_lock = threading.Lock()
+_sizes = {}
+
+
+def callback_output(request):
+    """The output of the Dash callback a request runs, or UNKNOWN if it is not
+    one of the app's callbacks."""
+    import dash
+
+    body = request.get_json(silent=True)
+    output = body.get('output') if isinstance(body, dict) else None
+    if isinstance(output, str) and output in dash.get_app().callback_map:
+        return output
+    return UNKNOWN
+
+
+def endpoint_name(request):
+    if request.path.endswith('/_dash-update-component'):
+        return 'callback ' + callback_output(request)
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return UNKNOWN
+
+
+def _length(response):
+    if response.direct_passthrough:
+        return response.content_length or 0
+    return response.calculate_content_length() or 0
+
+
+def _record(name, field, size):
+    with _lock:
+        entry = _sizes.setdefault(name, {'count': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'max_raw_bytes': 0, 'max_sent_bytes': 0})
+        if field == 'raw':
+            entry['count'] += 1
+            entry['raw_bytes'] += size
+            entry['max_raw_bytes'] = max(entry['max_raw_bytes'], size)
+        else:
+            entry['sent_bytes'] += size
+            entry['max_sent_bytes'] = max(entry['max_sent_bytes'], size)
+
+
+def report():
+    with _lock:
+        return {
+            name: dict(entry,
+                       mean_raw_bytes=entry['raw_bytes'] / entry['count'],
+                       mean_sent_bytes=entry['sent_bytes'] / entry['count'])
+            for name, entry in sorted(_sizes.items()) if entry['count']
+        }
+
+
+def reset():
+    with _lock:
+        _sizes.clear()
+
+
+def register(server):
+    # Call after Dash has set up compression. Flask runs after_request hooks
+    # in reverse order of registration, so the appended hook sees the response
+    # before compression and the one inserted at the front sees what is sent.
+    from flask import g, jsonify, request
+
+    def record_raw(response):
+        g.payload_endpoint = endpoint_name(request)
+        _record(g.payload_endpoint, 'raw', _length(response))
+        return response
+
+    def record_sent(response):
+        name = g.get('payload_endpoint')
+        if name is not None:
+            _record(name, 'sent', _length(response))
+        return response
+
+    server.after_request(record_raw)
+    server.after_request_funcs.setdefault(None, []).insert(0, record_sent)
+
+    @server.route(REPORT_ROUTE)
+    def payload_report():
+        return jsonify(report())
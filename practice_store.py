@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Indexed columnar store for the GP practice drill-down.
+#
+# etl.py's practices stage rewrites every PHS general practice prevalence file
+# (diseaseprevalenceingeneralpractice_*.csv - the board totals that ship with
+# the repo and any practice-level extracts added next to them) as one
+# uncompressed Arrow IPC file per health board and year, each sorted by area
+# type, practice, age and sex. _index.json lists the partitions and their row
+# counts, so a query only opens the boards and years it asks for.
+#
+# Partitions are memory-mapped rather than read: the workers share the pages
+# through the OS page cache and a query only copies the columns it filters or
+# sorts on. The result of a query is kept as the row positions of its matches,
+# and only the block of rows the grid asks for is materialised.
+
+import glob
+import itertools
+import json
+import os
+import shutil
+import warnings
+from collections import OrderedDict
+from urllib.parse import quote
+
+import metrics
+import startup
+from datasets import DATA_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+SOURCE_PATTERN = 'diseaseprevalenceingeneralpractice_*.csv'
+STORE_DIR = os.environ.get('PRACTICE_STORE_DIR', os.path.join(DATA_DIR, 'practice_store'))
+INDEX_FILE = '_index.json'
+CACHED_QUERIES = 16
+
+BOARD_COLUMN = 'Health Boards'
+YEAR_COLUMN = 'Year'
+AREA_COLUMN = 'GPPractice/Area'
+TEXT_COLUMNS = [AREA_COLUMN, 'Age', 'Sex', 'AreaType', 'PracticeCode']
+# Practice-level extracts name the board in one of these; board total rows
+# name it in AREA_COLUMN
+SOURCE_BOARD_COLUMNS = ('HBName', 'HB', 'Health Board', 'NHS Board')
+SORT_ORDER = ['AreaType', 'PracticeCode', AREA_COLUMN, 'Age', 'Sex']
+
+
+def source_files():
+    return sorted(os.path.basename(f) for f in glob.glob(os.path.join(DATA_DIR, SOURCE_PATTERN)))
+
+
+def index_output():
+    # The file etl.py hashes to tell whether the store is up to date
+    return os.path.relpath(os.path.join(STORE_DIR, INDEX_FILE), DATA_DIR)
+
+
+# Offline build
+
+def read_source(filename):
+    table = pacsv.read_csv(os.path.join(DATA_DIR, filename), convert_options=pacsv.ConvertOptions(
+        column_types={c: pa.string() for c in TEXT_COLUMNS}, strings_can_be_null=True))
+    named = next((c for c in SOURCE_BOARD_COLUMNS if c in table.column_names), None)
+    if named is not None:
+        boards = table[named].cast(pa.string())
+    else:
+        boards = pc.if_else(pc.equal(table['AreaType'], 'Board'), table[AREA_COLUMN], pa.scalar(None, pa.string()))
+    boards = pc.fill_null(pc.replace_substring_regex(boards, '^NHS ', ''), 'Unknown')
+    return table.append_column(BOARD_COLUMN, boards)
+
+
+def build(sources=None, directory=STORE_DIR):
+    sources = source_files() if sources is None else sources
+    table = pa.concat_tables([read_source(f) for f in sources], promote_options='permissive')
+    order = [(BOARD_COLUMN, 'ascending'), (YEAR_COLUMN, 'ascending')] + [(c, 'ascending') for c in SORT_ORDER if c in table.column_names]
+    table = table.sort_by(order)
+
+    # Build next to the live store and swap it in, so workers reading the
+    # old one never see a half-written directory
+    staging = '{}.tmp-{}'.format(directory, os.getpid())
+    shutil.rmtree(staging, ignore_errors=True)
+    partitions = []
+    keys = zip(table[BOARD_COLUMN].to_pylist(), table[YEAR_COLUMN].to_pylist())
+    start = 0
+    try:
+        for (board, year), rows in itertools.groupby(keys):
+            rows = sum(1 for _ in rows)
+            path = os.path.join('board=' + quote(board, safe=''), 'year={}'.format(year), 'part-0.arrow')
+            os.makedirs(os.path.dirname(os.path.join(staging, path)), exist_ok=True)
+            with pa.OSFile(os.path.join(staging, path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table.slice(start, rows))
+            partitions.append({'board': board, 'year': year, 'path': path, 'rows': rows})
+            start += rows
+        with open(os.path.join(staging, INDEX_FILE), 'w') as f:
+            json.dump({'sources': sources, 'columns': table.column_names, 'partitions': partitions}, f, indent=2)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    retired = '{}.old-{}'.format(directory, os.getpid())
+    if os.path.exists(directory):
+        os.rename(directory, retired)
+    os.rename(staging, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+    return len(partitions), table.num_rows
+
+
+# AgGrid filter and sort models
+
+def _condition(column, spec):
+    field = pc.field(column)
+    kind, value = spec.get('type'), spec.get('filter')
+    if kind == 'blank':
+        return field.is_null() | (pc.equal(field, '') if spec.get('filterType') == 'text' else pc.is_nan(field))
+    if kind == 'notBlank':
+        return ~_condition(column, dict(spec, type='blank'))
+    if spec.get('filterType') == 'text':
+        value = str(value or '')
+        return {
+            'contains': lambda: pc.match_substring(field, value, ignore_case=True),
+            'notContains': lambda: ~pc.match_substring(field, value, ignore_case=True),
+            'equals': lambda: pc.equal(pc.utf8_lower(field), value.lower()),
+            'notEqual': lambda: pc.not_equal(pc.utf8_lower(field), value.lower()),
+            'startsWith': lambda: pc.starts_with(field, value, ignore_case=True),
+            'endsWith': lambda: pc.ends_with(field, value, ignore_case=True),
+        }.get(kind, lambda: None)()
+    if value is None:
+        return None
+    return {
+        'equals': lambda: field == value,
+        'notEqual': lambda: field != value,
+        'lessThan': lambda: field < value,
+        'lessThanOrEqual': lambda: field <= value,
+        'greaterThan': lambda: field > value,
+        'greaterThanOrEqual': lambda: field >= value,
+        'inRange': lambda: (field >= value) & (field <= spec.get('filterTo', value)),
+    }.get(kind, lambda: None)()
+
+
+def filter_expression(filter_model, columns):
+    """The AgGrid filter model as one pyarrow expression (None for no filter).
+    Conditions on unknown columns or of unsupported types are ignored."""
+    combined = None
+    for column, spec in (filter_model or {}).items():
+        if column not in columns:
+            continue
+        conditions = spec.get('conditions') or [spec[k] for k in ('condition1', 'condition2') if k in spec] or [spec]
+        parts = [c for c in (_condition(column, dict(s, filterType=spec.get('filterType'))) for s in conditions) if c is not None]
+        if not parts:
+            continue
+        join = (lambda a, b: a | b) if spec.get('operator') == 'OR' else (lambda a, b: a & b)
+        expression = parts[0]
+        for part in parts[1:]:
+            expression = join(expression, part)
+        combined = expression if combined is None else combined & expression
+    return combined
+
+
+def partition_keys(filter_model):
+    # Boards and years pinned by a single 'equals' filter, used to skip partitions
+    def pinned(column, cast):
+        spec = (filter_model or {}).get(column) or {}
+        if spec.get('type') != 'equals' or spec.get('filter') is None:
+            return None
+        return {cast(spec['filter'])}
+    return pinned(BOARD_COLUMN, lambda v: str(v).lower()), pinned(YEAR_COLUMN, int)
+
+
+# Queries
+
+class PracticeStore:
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        path = os.path.join(directory, INDEX_FILE)
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path) as f:
+            index = json.load(f)
+        self.columns = index['columns']
+        self.partitions = index['partitions']
+        self.boards = sorted({p['board'] for p in self.partitions})
+        self.years = sorted({p['year'] for p in self.partitions})
+        self.rows = sum(p['rows'] for p in self.partitions)
+        self._mapped = {}
+        self._matches = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = startup.fork_safe_lock()
+
+    def _partition(self, partition):
+        # Zero-copy view of the file; pages are only read when touched
+        table = self._mapped.get(partition['path'])
+        if table is None:
+            source = pa.memory_map(os.path.join(self.directory, partition['path']))
+            table = self._mapped[partition['path']] = pa.ipc.open_file(source).read_all()
+        return table
+
+    def _table(self, boards, years):
+        selected = [p for p in self.partitions
+                    if (boards is None or p['board'].lower() in boards) and (years is None or p['year'] in years)]
+        if not selected:
+            return None
+        return pa.concat_tables([self._partition(p) for p in selected])
+
+    def _query(self, filter_model, sort_model):
+        table = self._table(*partition_keys(filter_model))
+        if table is None:
+            return None, pa.array([], pa.int64())
+        expression = filter_expression(filter_model, self.columns)
+        sort_keys = [(s['colId'], 'descending' if s.get('sort') == 'desc' else 'ascending')
+                     for s in sort_model or [] if s.get('colId') in self.columns]
+
+        # Only the filter and sort columns are copied, alongside the row positions
+        needed = sorted({c for c in (filter_model or {}) if c in self.columns} | {c for c, _ in sort_keys})
+        working = table.select(needed).append_column('_position', pa.array(range(table.num_rows), pa.int64()))
+        if expression is not None:
+            working = working.filter(expression)
+        if sort_keys:
+            working = working.take(pc.sort_indices(working, sort_keys=sort_keys))
+        return table, working['_position'].combine_chunks()
+
+    def matches(self, filter_model=None, sort_model=None):
+        key = json.dumps([filter_model, sort_model], sort_keys=True)
+        with self._lock:
+            if key in self._matches:
+                self._matches.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._matches[key]
+            self.stats['misses'] += 1
+        result = self._query(filter_model, sort_model)
+        with self._lock:
+            self._matches[key] = result
+            while len(self._matches) > CACHED_QUERIES:
+                self._matches.popitem(last=False)
+        return result
+
+    def page(self, start, end, columns=None, filter_model=None, sort_model=None):
+        """Rows start to end (exclusive) of the filtered, sorted data as
+        records, with the total number of matching rows."""
+        with metrics.phase('data'):
+            table, positions = self.matches(filter_model, sort_model)
+            if table is None:
+                return [], 0
+            columns = [c for c in columns or self.columns if c in self.columns]
+            block = table.select(columns).take(positions[max(start, 0):max(end, 0)])
+            return block.to_pylist(), len(positions)
+
+
+_store = None
+_store_lock = startup.fork_safe_lock()
+_build_failed = False
+
+
+def store():
+    """The current store, reopened when etl.py rebuilds it and built on first
+    use if it has never been built. None without pyarrow or source files, or
+    when the build fails (e.g. STORE_DIR can't be written)."""
+    global _store, _build_failed
+    if pa is None:
+        return None
+    index = os.path.join(STORE_DIR, INDEX_FILE)
+    with _store_lock:
+        if not os.path.exists(index):
+            if _build_failed or not source_files():
+                return None
+            try:
+                build()
+            except (OSError, pa.ArrowException) as error:
+                # Not retried in this process; etl.py --stage practices can still build it
+                _build_failed = True
+                warnings.warn('Could not build the GP practice store: {}'.format(error))
+                return None
+        if _store is None or _store.mtime != os.stat(index).st_mtime_ns:
+            _store = PracticeStore()
+        return _store
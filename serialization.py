@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Fast JSON for the figures the callbacks send.
+#
+# Plotly 6 and later already send numpy-backed trace data as plotly.js typed
+# arrays (base64 of the raw bytes) from to_plotly_json(), so figures are passed
+# through as they are; Python lists of short decimals stay smaller as plain
+# JSON. Dash's JSON encoding goes through orjson when it is installed.
+
+
+def use_fast_json():
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    import plotly.io.json
+    plotly.io.json.config.default_engine = 'orjson'
+    return True
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Startup timing for the dashboard.
+#
+# app.py times each dataset load and each Dash page module import and calls
+# report() once the app is built. Set STARTUP_REPORT to a path to also write the
+# timings as JSON, and STARTUP_BUDGET_SECONDS to fail the boot when it takes
+# longer than that.
+
+import contextlib
+import importlib
+import importlib.machinery
+import json
+import os
+import sys
+import threading
+import time
+
+STARTED = time.perf_counter()
+BUDGET = os.environ.get('STARTUP_BUDGET_SECONDS')
+REPORT_PATH = os.environ.get('STARTUP_REPORT')
+
+# Imported on first use by the callbacks; gunicorn.conf.py imports them in the
+# master instead so the workers share them
+DEFERRED_IMPORTS = ('plotly.express', 'plotly.graph_objects', 'plotly.io')
+
+timings = []
+
+
+@contextlib.contextmanager
+def timed(kind, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append({'kind': kind, 'name': name, 'seconds': time.perf_counter() - start})
+
+
+@contextlib.contextmanager
+def timed_pages(package='pages'):
+    # Dash imports the page modules itself, so time them at the loader while
+    # the app is being constructed. Times include the modules each page imports.
+    exec_module = importlib.machinery.SourceFileLoader.exec_module
+
+    def timed_exec_module(loader, module):
+        if not module.__name__.startswith(package + '.'):
+            return exec_module(loader, module)
+        with timed('page', module.__name__):
+            return exec_module(loader, module)
+
+    importlib.machinery.SourceFileLoader.exec_module = timed_exec_module
+    try:
+        yield
+    finally:
+        importlib.machinery.SourceFileLoader.exec_module = exec_module
+
+
+class _ForkSafeLock:
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = factory()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = self._factory()
+
+    def __enter__(self):
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._lock.__exit__(*exc_info)
+
+
+def fork_safe_lock(factory=threading.Lock):
+    """A lock that each forked worker gets a fresh copy of. gunicorn forks the
+    workers from the master after preloading, and a lock held by another thread
+    at that moment would never be released in the child."""
+    return _ForkSafeLock(factory)
+
+
+def import_deferred():
+    for name in DEFERRED_IMPORTS:
+        if name not in sys.modules:
+            with timed('import', name):
+                importlib.import_module(name)
+
+
+def report():
+    total = time.perf_counter() - STARTED
+    lines = ['Startup took {:.3f}s'.format(total)]
+    lines += ['  {:<12} {:<40} {:.3f}s'.format(t['kind'], t['name'], t['seconds']) for t in timings]
+    print('\n'.join(lines), file=sys.stderr)
+    if REPORT_PATH:
+        with open(REPORT_PATH, 'w') as f:
+            json.dump({'total_seconds': total, 'timings': timings}, f, indent=2)
+    if BUDGET and total > float(BUDGET):
+        raise RuntimeError('Startup took {:.3f}s, over the {}s budget'.format(total, BUDGET))
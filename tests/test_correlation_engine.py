@@ -0,0 +1,88 @@
+import itertools
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation_engine
+import datasets
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return correlation_engine.CorrelationMatrices(datasets.frame(correlation_engine.DATASET))
+
+
+def samples(engine, scope):
+    # (matrix, sample, factor), as the engine lays each scope out
+    return engine.values.transpose(1, 0, 2) if scope == correlation_engine.ACROSS_BOARDS else engine.values
+
+
+def correlation(x, y, method):
+    if method == 'spearman':
+        x, y = pd.Series(x).rank().to_numpy(), pd.Series(y).rank().to_numpy()
+    if np.ptp(x) == 0 or np.ptp(y) == 0:
+        return np.nan
+    return np.corrcoef(x, y)[0, 1]
+
+
+@pytest.mark.parametrize('method', correlation_engine.METHODS)
+@pytest.mark.parametrize('scope', [correlation_engine.ACROSS_BOARDS, correlation_engine.WITHIN_BOARD])
+def test_matrices_match_dataframe_corr(engine, method, scope):
+    for i, values in enumerate(samples(engine, scope)):
+        frame = pd.DataFrame(values, columns=engine.factors)
+        expected = frame.corr(method=method, min_periods=correlation_engine.MIN_PAIRS).to_numpy()
+        np.testing.assert_allclose(engine.r[method, scope][i], expected, rtol=0, atol=1e-12)
+        shared = frame.notna().astype(int)
+        np.testing.assert_array_equal(engine.n[method, scope][i], (shared.T @ shared).to_numpy())
+
+
+def test_spearman_ranks_each_pair_on_its_shared_samples():
+    # Ranked on all of its own samples, x would skip a rank where y is
+    # missing and no longer correlate perfectly with y
+    x = np.array([1.0, 2.5, 2.0, 3.0, 4.0])
+    y = np.array([10.0, np.nan, 20.0, 30.0, 40.0])
+    a, b = correlation_engine.pairwise(np.column_stack([x, y]))
+    r, n = correlation_engine.paired_correlation(correlation_engine.average_ranks(a), correlation_engine.average_ranks(b))
+    assert n[0, 1] == 4
+    assert r[0, 1] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('method', correlation_engine.METHODS)
+def test_within_board_pvalues_are_exact(engine, method):
+    # Every ordering of each pair's shared years, enumerated by hand
+    scope = correlation_engine.WITHIN_BOARD
+    for i, values in enumerate(samples(engine, scope)):
+        for a, b in itertools.permutations(range(len(engine.factors)), 2):
+            shared = ~np.isnan(values[:, a]) & ~np.isnan(values[:, b])
+            x, y = values[shared, a], values[shared, b]
+            observed = engine.r[method, scope][i, a, b]
+            p = engine.p[method, scope][i, a, b]
+            if np.isnan(observed):
+                assert np.isnan(p)
+                continue
+            null = [correlation(x, y[list(order)], method) for order in itertools.permutations(range(len(x)))]
+            assert p == pytest.approx(np.mean([abs(r) >= abs(observed) - 1e-12 for r in null]))
+            assert p >= 1 / math.factorial(len(x))
+
+
+def test_across_boards_pvalues_only_reorder_shared_samples():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(2, 14, 4))
+    values[0, :5, 1] = np.nan
+    values[1, 3:, 2] = np.nan
+    a, b = correlation_engine.pairwise(values)
+    r, n = correlation_engine.paired_correlation(a, b)
+    p = correlation_engine.permutation_pvalues(a, b, r, rng=np.random.default_rng(1))
+
+    orders = np.argsort(np.random.default_rng(1).random((correlation_engine.PERMUTATIONS, 14)), axis=1)
+    for m, i, j in itertools.product(range(2), range(4), range(4)):
+        if i == j:
+            assert np.isnan(p[m, i, j])
+            continue
+        shared = ~np.isnan(values[m, :, i]) & ~np.isnan(values[m, :, j])
+        x, y = values[m, shared, min(i, j)], values[m, shared, max(i, j)]
+        null = [correlation(x, y[[k for k in order if k < len(x)]], 'pearson') for order in orders]
+        expected = (sum(abs(v) >= abs(r[m, i, j]) - 1e-12 for v in null) + 1) / (correlation_engine.PERMUTATIONS + 1)
+        assert p[m, i, j] == pytest.approx(expected)
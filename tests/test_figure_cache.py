@@ -0,0 +1,40 @@
+import os
+import warnings
+
+import plotly.graph_objects as go
+
+import figure_cache
+
+
+def figures(calls):
+    calls.append(1)
+    return [go.Figure(go.Scatter(x=[1, 2, 3], y=[4.5, 5.5, 6.5])), go.Figure(go.Bar(x=['a', 'b'], y=[1, 2]))]
+
+
+def test_figures_are_shared_through_the_directory(tmp_path):
+    calls = []
+    first = figure_cache.FigureCache('shared', directory=str(tmp_path))
+    built = first.get(('key', 1), lambda: figures(calls))
+    second = figure_cache.FigureCache('shared', directory=str(tmp_path))
+    assert second.get(('key', 1), lambda: figures(calls)) == built
+    assert len(calls) == 1
+    assert second.stats == {'hits': 0, 'disk_hits': 1, 'misses': 0}
+
+
+def test_unwritable_directory_keeps_serving_from_memory(tmp_path):
+    blocked = tmp_path / 'file'
+    blocked.write_text('')
+    cache = figure_cache.FigureCache('blocked', directory=os.path.join(str(blocked), 'cache'))
+    calls = []
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        built = cache.get(('key', 1), lambda: figures(calls))
+        other = cache.get(('key', 2), lambda: figures(calls))
+    assert [f['data'][0]['type'] for f in built] == ['scatter', 'bar']
+    assert other == built
+    # Warned once, then the disk tier is off for the process
+    assert len(caught) == 1
+    assert cache.directory is None
+    assert cache.get(('key', 1), lambda: figures(calls)) == built
+    assert len(calls) == 2
+    assert cache.stats == {'hits': 1, 'disk_hits': 0, 'misses': 2}
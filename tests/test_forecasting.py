@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import datasets
+import forecasting
+
+# Non-consecutive years, with gaps in most series
+YEARS = np.array([2012, 2013, 2015, 2016, 2017, 2019, 2020, 2021, 2023, 2024], dtype=float)
+FUTURE = np.array([2025, 2026, 2028, 2030], dtype=float)
+
+
+@pytest.fixture(scope='module')
+def series():
+    rng = np.random.default_rng(3)
+    trend = rng.normal(0, 0.5, (40, 1)) * (YEARS - YEARS[0]) + rng.uniform(5, 20, (40, 1))
+    y = trend + rng.normal(0, 1, trend.shape)
+    gaps = rng.random(y.shape) < 0.25
+    gaps[:4] = False
+    y[gaps] = np.nan
+    # Too short to fit: one, two and three observations, and a trailing gap
+    y[4, 1:] = np.nan
+    y[5, 2:] = np.nan
+    y[6, 3:] = np.nan
+    y[7, -3:] = np.nan
+    return y
+
+
+def observed(x, y):
+    keep = ~np.isnan(y)
+    return x[keep], y[keep]
+
+
+def test_t95():
+    np.testing.assert_array_equal(forecasting.t95([1, 2, 10, 30]), [12.706, 4.303, 2.228, 2.042])
+    assert forecasting.t95(31) == forecasting.Z95
+    assert np.isnan(forecasting.t95(0))
+
+
+def test_linear_trend_matches_polyfit(series):
+    forecast, half_width, sse = forecasting.linear_trend(YEARS[None, :], series, FUTURE)
+    for row in range(len(series)):
+        x, y = observed(YEARS, series[row])
+        n = len(x)
+        if n < 2:
+            assert np.isnan(forecast[row]).all() and np.isnan(half_width[row]).all()
+            continue
+        slope, intercept = np.polyfit(x, y, 1)
+        expected = intercept + slope * FUTURE
+        np.testing.assert_allclose(forecast[row], expected, rtol=1e-9)
+        residuals = y - (intercept + slope * x)
+        np.testing.assert_allclose(sse[row], residuals @ residuals, rtol=1e-7, atol=1e-9)
+        if n == 2:
+            assert np.isnan(half_width[row]).all()
+            continue
+        # Prediction interval for a new observation at each future x
+        s = np.sqrt(residuals @ residuals / (n - 2))
+        spread = np.sqrt(1 + 1 / n + (FUTURE - x.mean()) ** 2 / ((x - x.mean()) ** 2).sum())
+        np.testing.assert_allclose(half_width[row], forecasting.T95[n - 3] * s * spread, rtol=1e-7)
+
+
+def holt_reference(x, y, future):
+    # One series at a time, as the textbook recursion reads
+    x, y = observed(x, y)
+    n = len(y)
+    if n < 2:
+        return np.full(len(future), np.nan), np.full(len(future), np.nan)
+    best = None
+    for alpha, beta in forecasting.HOLT_GRID:
+        level, trend, sse = y[1], y[1] - y[0], 0.0
+        for value in y[2:]:
+            error = value - (level + trend)
+            sse += error ** 2
+            level, trend = level + trend + alpha * error, trend + alpha * beta * error
+        if best is None or sse < best[0]:
+            best = (sse, level, trend, alpha, beta)
+    sse, level, trend, alpha, beta = best
+    forecast, half_width = [], []
+    for target in future:
+        h = int(target - x[-1])
+        forecast.append(level + h * trend)
+        sigma2 = sse / (n - 2) if n > 2 else np.nan
+        variance = sigma2 * (1 + sum((alpha * (1 + j * beta)) ** 2 for j in range(1, h)))
+        half_width.append(forecasting.Z95 * np.sqrt(variance))
+    return np.array(forecast), np.array(half_width)
+
+
+def test_holt_matches_per_series_loop(series):
+    forecast, half_width, sse, n = forecasting.holt(YEARS[None, :], series, FUTURE)
+    np.testing.assert_array_equal(n, (~np.isnan(series)).sum(axis=1))
+    for row in range(len(series)):
+        expected_forecast, expected_width = holt_reference(YEARS, series[row], FUTURE)
+        np.testing.assert_allclose(forecast[row], expected_forecast, rtol=1e-9)
+        np.testing.assert_allclose(half_width[row], expected_width, rtol=1e-9)
+
+
+def test_metric_forecasts_fit_each_board_and_metric():
+    df = datasets.frame(forecasting.TIMESERIES)
+    forecasts = forecasting.MetricForecasts(df)
+    assert forecasts.future[0] == df['Year'].max() + 1
+    for board in forecasts.boards:
+        rows = df[df['Health Boards'] == board].sort_values('Year')
+        for metric in forecasts.metrics:
+            result = forecasts.series(board, metric, 'linear')
+            np.testing.assert_array_equal(result['values'][np.isin(result['years'], rows['Year'])], rows[metric])
+            x, y = observed(rows['Year'].to_numpy(dtype=float), rows[metric].to_numpy(dtype=float))
+            if len(x) >= 2:
+                slope, intercept = np.polyfit(x, y, 1)
+                np.testing.assert_allclose(result['forecast'], intercept + slope * forecasts.future, rtol=1e-9, atol=1e-9)
+            assert forecasts.series(board, metric)['method'] in forecasting.METHODS
+
+
+def test_population_projection_matches_cohort_loop():
+    rng = np.random.default_rng(5)
+    ages = [str(a) for a in range(91)]
+    rows = []
+    for board in ('Fife', 'Borders'):
+        for year in range(2015, 2023):
+            for sex in ('Persons', 'Males'):
+                rows.append(dict({'Area name': board, 'Year': year, 'Sex': sex}, **dict(zip(ages, rng.integers(100, 2000, 91)))))
+    df = pd.DataFrame(rows)
+    projection = forecasting.PopulationProjection(df)
+    assert projection.boards == ['Borders', 'Fife']
+    np.testing.assert_array_equal(projection.future, np.arange(2023, 2023 + forecasting.POPULATION_HORIZON))
+
+    for b, board in enumerate(projection.boards):
+        counts = df[(df['Area name'] == board) & (df['Sex'] == 'Persons')].sort_values('Year')[ages].to_numpy(dtype=float)
+        recent = counts[-(forecasting.RATIO_YEARS + 1):]
+        before, after = recent[:-1].sum(axis=0), recent[1:].sum(axis=0)
+        ratios = np.ones(91)
+        ratios[0] = after[0] / before[15:45].sum()
+        for age in range(1, 90):
+            ratios[age] = after[age] / before[age - 1]
+        ratios[90] = after[90] / (before[89] + before[90])
+
+        current = counts[-1]
+        for h in range(forecasting.POPULATION_HORIZON):
+            following = np.empty(91)
+            following[0] = ratios[0] * current[15:45].sum()
+            for age in range(1, 90):
+                following[age] = ratios[age] * current[age - 1]
+            following[90] = ratios[90] * (current[89] + current[90])
+            np.testing.assert_allclose(projection.projected[b, h], following, rtol=1e-12)
+            current = following
+
+        result = projection.series(board)
+        total = counts.sum(axis=1)
+        np.testing.assert_allclose(result['total'], total)
+        np.testing.assert_allclose(result['mean_age'], counts @ np.arange(91) / total)
+        median = [np.searchsorted(np.cumsum(c), c.sum() / 2) for c in counts]
+        np.testing.assert_array_equal(result['median_age'], median)
+        np.testing.assert_allclose(result['forecast_total'], projection.projected[b].sum(axis=1))
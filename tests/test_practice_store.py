@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import practice_store
+
+BOARD = practice_store.BOARD_COLUMN
+AREA = practice_store.AREA_COLUMN
+RATE = 'Rate_Coronary Heart Disease (CHD)'
+COUNT = 'PatientCount_Coronary Heart Disease (CHD)'
+COLUMNS = [BOARD, 'Year', 'PracticeCode', AREA, 'Age', 'Sex', COUNT, RATE]
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    # A practice-level extract: boards named in HBName, with some practice
+    # codes and rates missing
+    rng = np.random.default_rng(7)
+    rows = []
+    for board in ('NHS Fife', 'NHS Grampian', 'NHS Lothian'):
+        for year in (2022, 2023, 2024):
+            for practice in range(4):
+                for age in ('00-4', '05-9', '65-69'):
+                    for sex in ('Female', 'Male'):
+                        rows.append({AREA: '{} Practice {}'.format(board.split()[-1], practice), 'Year': year,
+                                     'Age': age, 'Sex': sex, 'AreaType': 'Practice', 'HBName': board,
+                                     'PracticeCode': None if practice == 3 else '{}{:02d}'.format(board[4], practice)})
+    df = pd.DataFrame(rows)
+    df[COUNT] = rng.permutation(len(df))
+    df[RATE] = np.round(rng.uniform(0, 8, len(df)), 1)
+    df.loc[rng.choice(len(df), 12, replace=False), RATE] = np.nan
+    directory = tmp_path_factory.mktemp('source')
+    df.to_csv(directory / 'diseaseprevalenceingeneralpractice_practices.csv', index=False)
+    return directory
+
+
+@pytest.fixture
+def store(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(practice_store, 'DATA_DIR', str(source))
+    practice_store.build(sources=practice_store.source_files(), directory=str(tmp_path / 'store'))
+    return practice_store.PracticeStore(str(tmp_path / 'store'))
+
+
+@pytest.fixture(scope='module')
+def reference(source):
+    df = pd.read_csv(source / 'diseaseprevalenceingeneralpractice_practices.csv', dtype={'PracticeCode': str})
+    df[BOARD] = df['HBName'].str.replace('^NHS ', '', regex=True)
+    # The order the store keeps its rows in
+    return df.sort_values([BOARD, 'Year'] + practice_store.SORT_ORDER, kind='stable').reset_index(drop=True)
+
+
+def records(df):
+    return [tuple(r) for r in df[COLUMNS].astype(object).where(df[COLUMNS].notna(), None).itertuples(index=False)]
+
+
+def page(store, start=0, end=10000, **query):
+    rows, count = store.page(start, end, COLUMNS, **query)
+    return [tuple(r[c] for c in COLUMNS) for r in rows], count
+
+
+def text(kind, value=None):
+    return {'filterType': 'text', 'type': kind, 'filter': value}
+
+
+def number(kind, value=None, to=None):
+    spec = {'filterType': 'number', 'type': kind, 'filter': value}
+    if to is not None:
+        spec['filterTo'] = to
+    return spec
+
+
+def test_store_partitions_by_board_and_year(store, reference):
+    assert store.boards == ['Fife', 'Grampian', 'Lothian']
+    assert store.years == [2022, 2023, 2024]
+    assert len(store.partitions) == 9
+    assert store.rows == len(reference)
+    assert page(store) == (records(reference), len(reference))
+
+
+def test_page_slices_the_matches(store, reference):
+    assert page(store, 50, 75) == (records(reference.iloc[50:75]), len(reference))
+    assert page(store, len(reference) - 5, len(reference) + 100) == (records(reference.iloc[-5:]), len(reference))
+
+
+@pytest.mark.parametrize('filter_model, expected', [
+    ({AREA: text('contains', 'FIFE practice')}, lambda df: df[AREA].str.contains('fife practice', case=False)),
+    ({AREA: text('notContains', 'practice 1')}, lambda df: ~df[AREA].str.lower().str.contains('practice 1')),
+    ({AREA: text('startsWith', 'grampian')}, lambda df: df[AREA].str.startswith('Grampian')),
+    ({AREA: text('endsWith', 'PRACTICE 2')}, lambda df: df[AREA].str.endswith('Practice 2')),
+    ({'Sex': text('equals', 'female')}, lambda df: df['Sex'] == 'Female'),
+    ({'Sex': text('notEqual', 'FEMALE')}, lambda df: df['Sex'] != 'Female'),
+    ({'PracticeCode': text('blank')}, lambda df: df['PracticeCode'].isna()),
+    ({'PracticeCode': text('notBlank')}, lambda df: df['PracticeCode'].notna()),
+    ({RATE: number('blank')}, lambda df: df[RATE].isna()),
+    ({RATE: number('notBlank')}, lambda df: df[RATE].notna()),
+    ({RATE: number('greaterThan', 4)}, lambda df: df[RATE] > 4),
+    ({RATE: number('lessThanOrEqual', 1.5)}, lambda df: df[RATE] <= 1.5),
+    ({RATE: number('inRange', 2, 3)}, lambda df: df[RATE].between(2, 3)),
+    ({COUNT: number('notEqual', 10)}, lambda df: df[COUNT] != 10),
+    # The two condition forms AgGrid sends, joined by AND or OR
+    ({'Age': {'filterType': 'text', 'operator': 'OR', 'conditions': [text('equals', '00-4'), text('equals', '65-69')]}},
+     lambda df: df['Age'].isin(['00-4', '65-69'])),
+    ({RATE: {'filterType': 'number', 'operator': 'AND', 'condition1': number('greaterThan', 1), 'condition2': number('lessThan', 5)}},
+     lambda df: (df[RATE] > 1) & (df[RATE] < 5)),
+    # Filters on different columns are combined
+    ({'Sex': text('equals', 'Male'), RATE: number('greaterThanOrEqual', 6)}, lambda df: (df['Sex'] == 'Male') & (df[RATE] >= 6)),
+    # Unknown columns and incomplete conditions are ignored
+    ({'Nonexistent': text('equals', 'x'), RATE: number('greaterThan')}, lambda df: pd.Series(True, index=df.index)),
+])
+def test_filters_match_pandas(store, reference, filter_model, expected):
+    matched = reference[expected(reference)]
+    assert page(store, filter_model=filter_model) == (records(matched), len(matched))
+
+
+@pytest.mark.parametrize('direction', ['asc', 'desc'])
+def test_sort_matches_pandas(store, reference, direction):
+    filter_model = {'Sex': text('equals', 'Male')}
+    sort_model = [{'colId': COUNT, 'sort': direction}]
+    matched = reference[reference['Sex'] == 'Male'].sort_values(COUNT, ascending=direction == 'asc')
+    assert page(store, 10, 30, filter_model=filter_model, sort_model=sort_model) == (records(matched.iloc[10:30]), len(matched))
+
+
+def test_board_and_year_filters_prune_partitions(store, reference):
+    # Board names are pinned case-insensitively, as the text filter matches them
+    filter_model = {BOARD: text('equals', 'grampian'), 'Year': number('equals', 2023)}
+    matched = reference[(reference[BOARD] == 'Grampian') & (reference['Year'] == 2023)]
+    assert page(store, filter_model=filter_model) == (records(matched), len(matched))
+    assert list(store._mapped) == ['board=Grampian/year=2023/part-0.arrow']
+
+    filter_model = {BOARD: text('equals', 'FIFE')}
+    matched = reference[reference[BOARD] == 'Fife']
+    assert page(store, filter_model=filter_model) == (records(matched), len(matched))
+    assert sorted(store._mapped) == ['board=Fife/year={}/part-0.arrow'.format(y) for y in store.years] + ['board=Grampian/year=2023/part-0.arrow']
+
+
+def test_no_matching_partition(store):
+    assert store.page(0, 100, COLUMNS, {BOARD: text('equals', 'Tayside')}) == ([], 0)
+    assert store._mapped == {}
+
+
+def test_repeated_queries_are_cached(store):
+    filter_model = {'Sex': text('equals', 'Male')}
+    first = store.page(0, 10, COLUMNS, filter_model)
+    assert store.page(10, 20, COLUMNS, filter_model)[1] == first[1]
+    assert store.stats == {'hits': 1, 'misses': 1}
+
+
+def test_board_totals_name_their_board_in_the_area_column(tmp_path):
+    # The extract that ships with the repo has no board column of its own
+    filename = 'diseaseprevalenceingeneralpractice_board_total.csv'
+    partitions, rows = practice_store.build(sources=[filename], directory=str(tmp_path / 'store'))
+    store = practice_store.PracticeStore(str(tmp_path / 'store'))
+    df = pd.read_csv(os.path.join(practice_store.DATA_DIR, filename))
+    boards = df[practice_store.AREA_COLUMN].str.replace('^NHS ', '', regex=True)
+    assert rows == len(df)
+    assert partitions == len(df.groupby([boards, 'Year']))
+    assert store.boards == sorted(boards.unique())
+    fife = store.page(0, 1000, [AREA], {BOARD: text('equals', 'fife')})
+    assert fife[1] == (boards == 'Fife').sum()
+    assert {r[AREA] for r in fife[0]} == {'NHS Fife'}
+
+
+def test_blank_numbers_include_nan():
+    # CSV sources read NaN as null, but the expression also has to cover NaN
+    table = practice_store.pa.table({RATE: [1.0, None, float('nan'), 0.0]})
+    blank = practice_store.filter_expression({RATE: number('blank')}, [RATE])
+    not_blank = practice_store.filter_expression({RATE: number('notBlank')}, [RATE])
+    assert table.filter(blank)[RATE].to_pylist()[0] is None
+    assert len(table.filter(blank)) == 2
+    assert table.filter(not_blank)[RATE].to_pylist() == [1.0, 0.0]